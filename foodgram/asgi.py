@@ -9,8 +9,49 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.conf import settings
 from django.core.asgi import get_asgi_application
+from django.db import connections
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('ASYNC_API_VIEWS', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+def warm_up():
+    """Warm-up of `recipes.warmup` without opening DB connections.
+
+    Connections belong to the thread that opens them, and requests run
+    on threads of their own.
+    """
+    from recipes.warmup import warm_up
+
+    warm_up([step for step in settings.WARM_UP_STEPS if step != 'databases'])
+    connections.close_all()
+
+
+async def lifespan(receive, send):
+    """Warm the process up on server startup."""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await sync_to_async(warm_up, thread_sensitive=False)()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """Run sync code of every request on a thread of its own.
+
+    Django 3.2 runs sync views, middleware and ORM calls of all requests
+    of a process on one shared thread, so concurrent requests would wait
+    for each other's queries.
+    """
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    async with ThreadSensitiveContext():
+        await django_application(scope, receive, send)
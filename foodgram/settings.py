@@ -36,10 +36,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'recipes.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'recipes.middleware.CartMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -77,6 +79,34 @@ DATABASES = {
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': os.environ.get('DB_HOST'),
         'PORT': os.environ.get('DB_PORT'),
+        # keep connections opened by worker warm-up, with gunicorn sync
+        # workers only: ASGI requests run on threads of their own
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+    }
+}
+
+# read replicas of the default database, comma separated hosts;
+# any other aliases may be listed in REPLICA_DATABASES instead
+REPLICA_HOSTS = [host.strip() for host in
+                 os.environ.get('DB_REPLICA_HOSTS', '').split(',')
+                 if host.strip()]
+REPLICA_DATABASES = [f'replica_{number}'
+                     for number in range(len(REPLICA_HOSTS))]
+DATABASES.update({
+    alias: {**DATABASES['default'], 'HOST': host,
+            'TEST': {'MIRROR': 'default'}}
+    for alias, host in zip(REPLICA_DATABASES, REPLICA_HOSTS)
+})
+
+DATABASE_ROUTERS = ['recipes.routers.ReplicaRouter']
+
+# shared by all web and worker processes: version stamps of the
+# process-local indexes, card fragments and cart counters must be seen by
+# every process, so a per-process LocMemCache is not enough
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'memcached:11211'),
     }
 }
 
@@ -137,6 +167,52 @@ STATICFILES_DIRS = (
 # objects on default page
 LIST_OBJECTS = 6
 
+# `cursor` (keyset) or `offset` (numbered pages) for recipe lists
+RECIPE_LIST_PAGINATION = 'cursor'
+
+# seconds to keep rendered recipe cards, see recipes.card_cache
+RECIPE_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# max items in ingredient autocomplete response
+INGREDIENTS_AUTOCOMPLETE_LIMIT = 20
+
+# max recipes in search API response, see recipes.search
+SEARCH_RESULTS_LIMIT = 20
+
+# pantry search limits, see recipes.pantry
+PANTRY_MAX_INGREDIENTS = 50
+PANTRY_RESULTS_LIMIT = 120
+
+# "also favourited" recipes on recipe page, see recipes.recommendations
+RECIPE_NEIGHBOURS_SHOWN = 4
+
+# image processing queue, see recipes.image_jobs
+IMAGE_JOB_MAX_ATTEMPTS = 5
+# seconds a claimed job is hidden from other workers
+IMAGE_JOB_VISIBILITY_TIMEOUT = 5 * 60
+# seconds before the first retry, doubled on every next one
+IMAGE_JOB_RETRY_DELAY = 30
+# days to keep finished jobs for metrics
+IMAGE_JOB_KEEP_DAYS = 7
+
+# seconds a client reads from the primary database after a write,
+# see recipes.routers
+PRIMARY_STICKY_SECONDS = 10
+
+# recipes.warmup steps run by every server worker before its first request;
+# add 'pantry' to build the pantry search index too, on a big database it
+# takes seconds per worker
+WARM_UP_STEPS = ('templates', 'urls', 'rest_framework', 'databases',
+                 'catalogs')
+
+# serve single-item API endpoints with recipes.api.async_views; foodgram.asgi
+# turns it on, under WSGI the DRF views avoid an async_to_sync per request
+ASYNC_API_VIEWS = os.environ.get('ASYNC_API_VIEWS', '0') == '1'
+
+# render favourite, cart and follow buttons in their default state and let
+# JS set them from /api/state/, so page HTML is the same for all users
+USER_STATE_HYDRATION = True
+
 # Default primary key field type
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -0,0 +1,10 @@
+"""Gunicorn settings, read from the working directory on start."""
+# import the project once in the master, workers are forked with it
+preload_app = True
+
+
+def post_worker_init(worker):
+    """Warm up every worker before it accepts requests."""
+    from recipes.warmup import warm_up
+
+    warm_up(log=worker.log.info, notify=worker.notify)
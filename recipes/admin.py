@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from recipes.models import (Favourite, Follow, Ingredient, Recipe,
+from recipes.models import (Favourite, Follow, ImageJob, Ingredient, Recipe,
                             RecipeIngredient, RecipeTag, Tag)
 
 
@@ -23,11 +23,9 @@ class RecipeAdmin(admin.ModelAdmin):
     inlines = [IngredientInLine,
                TagInLine,
                ]
-    list_display = ('pk', 'name', 'author', 'pub_date', 'likes')
+    list_display = ('pk', 'name', 'author', 'pub_date', 'favourite_count')
     list_filter = ('pub_date', 'name', )
-
-    def likes(self, obj):
-        return obj.favourite_by.count()
+    list_select_related = ('author',)
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -45,9 +43,17 @@ class FavouriteAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
 
 
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'recipe', 'status', 'attempts', 'created',
+                    'finished')
+    list_filter = ('status',)
+    raw_id_fields = ('recipe',)
+
+
 admin.site.register(Tag)
 admin.site.register(RecipeIngredient)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Favourite, FavouriteAdmin)
+admin.site.register(ImageJob, ImageJobAdmin)
 admin.site.register(Follow)
@@ -0,0 +1,166 @@
+"""Native async API endpoints for the ASGI entry point.
+
+Django 3.2 has no async ORM, so each view runs all of its database
+work, loading `request.user` included, in one `sync_to_async` call on
+the request's thread. Everything else (routing, middleware, body and
+response handling) stays on the event loop. They are routed only with
+`ASYNC_API_VIEWS` (set by `foodgram.asgi`), under WSGI the DRF views of
+`recipes.api.views` serve the same endpoints.
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import (HttpResponse, HttpResponseNotAllowed,
+                         HttpResponseNotModified, JsonResponse)
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import PermissionDenied
+
+from recipes.cart import change_purchases_count
+from recipes.ingredient_index import ingredient_index
+from recipes.models import CartRecipe, Favourite, Follow, Recipe, User
+
+
+def async_api_view(method, login_required=True):
+    """Turn sync `handler(request, ...)` into an async view.
+
+    If `login_required`, anonymous users get 403 and, like in DRF views
+    with session authentication, CSRF is checked by the view instead of
+    `CsrfViewMiddleware`. Public views never load the user.
+    """
+    def decorator(handler):
+        def guarded(request, *args, **kwargs):
+            if login_required:
+                if not request.user.is_authenticated:
+                    return JsonResponse({'success': False}, status=403)
+                try:
+                    SessionAuthentication().enforce_csrf(request)
+                except PermissionDenied as error:
+                    return JsonResponse({'detail': str(error.detail)},
+                                        status=403)
+            return handler(request, *args, **kwargs)
+
+        run = sync_to_async(guarded)
+
+        @wraps(handler)
+        async def view(request, *args, format=None, **kwargs):
+            if request.method != method:
+                return HttpResponseNotAllowed([method])
+            return await run(request, *args, **kwargs)
+
+        # `csrf_exempt` of Django 3.2 would hide the coroutine function
+        view.csrf_exempt = True
+        return view
+    return decorator
+
+
+def posted_id(request):
+    """`id` of a JSON or form POST body, None if missing or invalid."""
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        data = request.POST
+    try:
+        return int(data['id'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def success(ok=True):
+    return JsonResponse({'success': ok}, status=200 if ok else 404)
+
+
+def bad_request():
+    return JsonResponse({'success': False}, status=400)
+
+
+@async_api_view('POST')
+def add_favourite(request):
+    """Add a Recipe to Favorites of a User."""
+    recipe_id = posted_id(request)
+    if recipe_id is None:
+        return bad_request()
+    if not Recipe.objects.filter(pk=recipe_id).exists():
+        return success(False)
+    _, created = Favourite.objects.get_or_create(
+        user=request.user, recipe_id=recipe_id,
+    )
+    if created:
+        Recipe.objects.filter(pk=recipe_id).change_favourite_count(1)
+    return success()
+
+
+@async_api_view('DELETE')
+def remove_favourite(request, pk):
+    """Remove a Recipe from User's Favorites."""
+    deleted, _ = Favourite.objects.filter(
+        recipe_id=pk, user=request.user
+    ).delete()
+    if deleted:
+        Recipe.objects.filter(pk=pk).change_favourite_count(-deleted)
+    return success(bool(deleted))
+
+
+@async_api_view('POST')
+def subscribe(request):
+    author_id = posted_id(request)
+    if author_id is None:
+        return bad_request()
+    if not User.objects.filter(pk=author_id).exists():
+        return success(False)
+    Follow.objects.get_or_create(user=request.user, author_id=author_id)
+    return success()
+
+
+@async_api_view('DELETE')
+def unsubscribe(request, pk):
+    deleted, _ = Follow.objects.filter(
+        user=request.user, author_id=pk
+    ).delete()
+    return success(bool(deleted))
+
+
+@async_api_view('POST')
+def add_purchase(request):
+    recipe_id = posted_id(request)
+    if recipe_id is None:
+        return bad_request()
+    if not Recipe.objects.filter(pk=recipe_id).exists():
+        return success(False)
+    _, created = CartRecipe.objects.get_or_create(
+        cart=request.cart.cart, recipe_id=recipe_id,
+    )
+    if created:
+        change_purchases_count(request.user.id, 1)
+    return success()
+
+
+@async_api_view('DELETE')
+def remove_purchase(request, pk):
+    deleted, _ = CartRecipe.objects.filter(
+        recipe_id=pk, cart__owner=request.user
+    ).delete()
+    if deleted:
+        change_purchases_count(request.user.id, -deleted)
+    return success(bool(deleted))
+
+
+@async_api_view('GET', login_required=False)
+def ingredients(request):
+    """Autocomplete ingredients from the process-local index."""
+    user_input = request.GET.get('query', '').strip('/')
+    try:
+        limit = int(request.GET['limit'])
+    except (KeyError, ValueError):
+        limit = None
+    else:
+        limit = max(1, min(limit, settings.INGREDIENTS_AUTOCOMPLETE_LIMIT))
+
+    etag, body = ingredient_index.search(user_input, limit)
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    return response
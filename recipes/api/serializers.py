@@ -1,6 +1,10 @@
+from django.conf import settings
 from rest_framework import serializers
 
-from recipes.models import Ingredient
+from recipes.models import Ingredient, Recipe
+from recipes.pantry import ORDERS
+
+BATCH_MAX_SIZE = 1000
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -10,3 +14,74 @@ class IngredientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ('title', 'dimension')
+
+
+class RecipeSearchSerializer(serializers.ModelSerializer):
+    author = serializers.CharField(source='author.username')
+    rank = serializers.FloatField()
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'name', 'author', 'cook_time', 'image', 'rank')
+
+
+class PantryRecipeSerializer(serializers.ModelSerializer):
+    author = serializers.CharField(source='author.username')
+    have = serializers.IntegerField(source='pantry.have')
+    missing = serializers.IntegerField(source='pantry.missing')
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'name', 'author', 'cook_time', 'image',
+                  'have', 'missing')
+
+
+class PantrySerializer(serializers.Serializer):
+    """Query of the pantry search endpoint."""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=settings.PANTRY_MAX_INGREDIENTS,
+    )
+    order = serializers.ChoiceField(choices=ORDERS, default=ORDERS[0])
+    limit = serializers.IntegerField(
+        min_value=1, max_value=settings.PANTRY_RESULTS_LIMIT,
+        default=settings.SEARCH_RESULTS_LIMIT,
+    )
+
+
+class ItemSerializer(serializers.Serializer):
+    """Payload of single-item endpoints: `{"id": id}`."""
+    id = serializers.IntegerField(min_value=1)
+
+
+class BatchSerializer(serializers.Serializer):
+    """Payload of batch endpoints: a list of ids or the whole set."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=BATCH_MAX_SIZE,
+        required=False,
+    )
+    author = serializers.IntegerField(min_value=1, required=False)
+    all = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if not (data.get('ids') or data.get('author') or data['all']):
+            raise serializers.ValidationError(
+                'Нужно передать ids, author или all'
+            )
+        return data
+
+
+class UserStateSerializer(serializers.Serializer):
+    """Query of the user state endpoint: ids shown on a page."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=BATCH_MAX_SIZE,
+        required=False,
+    )
+    authors = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        max_length=BATCH_MAX_SIZE,
+        required=False,
+    )
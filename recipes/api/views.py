@@ -1,21 +1,45 @@
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseNotModified
 from rest_framework import status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from recipes.api.serializers import IngredientSerializer
-from recipes.models import (Cart, CartRecipe, Favourite, Follow, Ingredient,
-                            User)
+from recipes.api.serializers import (BatchSerializer, ItemSerializer,
+                                     PantryRecipeSerializer, PantrySerializer,
+                                     RecipeSearchSerializer,
+                                     UserStateSerializer)
+from recipes.cart import change_purchases_count
+from recipes.ingredient_index import ingredient_index
+from recipes.models import CartRecipe, Favourite, Follow, Recipe, User
+from recipes.pantry import pantry_index
+from recipes.search import search_recipes
+
+
+def get_posted_id(request, queryset):
+    """Validated `id` of the request body, 404 unless `queryset` has it."""
+    serializer = ItemSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    pk = serializer.validated_data['id']
+    if not queryset.filter(pk=pk).exists():
+        raise NotFound()
+    return pk
 
 
 class AddToFavorites(APIView):
     """Add a Recipe to Favorites of a User."""
 
     def post(self, request, format=None):
-        Favourite.objects.get_or_create(
+        recipe_id = get_posted_id(request, Recipe.objects.all())
+        _, created = Favourite.objects.get_or_create(
             user=request.user,
-            recipe_id=request.data['id'],
+            recipe_id=recipe_id,
         )
+        if created:
+            Recipe.objects.filter(pk=recipe_id).change_favourite_count(1)
         return Response({'success': True}, status=status.HTTP_200_OK)
 
 
@@ -23,9 +47,11 @@ class RemoveFromFavorites(APIView):
     """Remove a Recipe from User's Favorites."""
 
     def delete(self, request, pk, format=None):
-        f = Favourite.objects.all().count()
-        Favourite.objects.filter(recipe_id=pk, user=request.user).delete()
-        if f > Favourite.objects.count():
+        deleted, _ = Favourite.objects.filter(
+            recipe_id=pk, user=request.user
+        ).delete()
+        if deleted:
+            Recipe.objects.filter(pk=pk).change_favourite_count(-deleted)
             return Response({'success': True}, status=status.HTTP_200_OK)
         return Response({'success': False}, status=status.HTTP_404_NOT_FOUND)
 
@@ -35,7 +61,7 @@ class Subscribe(APIView):
     def post(self, request, format=None):
         Follow.objects.get_or_create(
             user=request.user,
-            author_id=request.data['id']
+            author_id=get_posted_id(request, User.objects.all()),
         )
         return Response({'success': True}, status=status.HTTP_200_OK)
 
@@ -43,46 +69,292 @@ class Subscribe(APIView):
 class UnSubscribe(APIView):
 
     def delete(self, request, pk, format=None):
-        author = get_object_or_404(User, pk=pk)
-        f = Follow.objects.all().count()
-        Follow.objects.filter(user=request.user, author=author).delete()
-        if f > Follow.objects.all().count():
+        deleted, _ = Follow.objects.filter(
+            user=request.user, author_id=pk
+        ).delete()
+        if deleted:
             return Response({'success': True}, status=status.HTTP_200_OK)
         return Response({'success': False}, status=status.HTTP_404_NOT_FOUND)
 
 
 class GetIngredients(APIView):
+    """Autocomplete ingredients from the process-local index."""
+
     def get(self, request):
-        queryset = Ingredient.objects.all()
-        user_input = request.query_params.get('query').strip('/')
-        if user_input is not None:
-            queryset = queryset.filter(name__startswith=user_input)
-        list_ingredients = []
-        for ingredient in queryset:
-            list_ingredients.append(IngredientSerializer(ingredient).data)
-        return Response(list_ingredients)
+        user_input = request.query_params.get('query', '').strip('/')
+        try:
+            limit = int(request.query_params['limit'])
+        except (KeyError, ValueError):
+            limit = None
+        else:
+            limit = max(1, min(limit, settings.INGREDIENTS_AUTOCOMPLETE_LIMIT))
+
+        etag, body = ingredient_index.search(user_input, limit)
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        return response
+
+
+class SearchRecipes(APIView):
+    """Full-text search of recipes, most relevant first."""
+
+    def get(self, request, format=None):
+        try:
+            limit = int(request.query_params['limit'])
+        except (KeyError, ValueError):
+            limit = settings.SEARCH_RESULTS_LIMIT
+        limit = max(1, min(limit, settings.SEARCH_RESULTS_LIMIT))
+        recipes = search_recipes(
+            Recipe.objects.select_related('author').only(
+                'pk', 'name', 'cook_time', 'image', 'pub_date',
+                'author__username',
+            ),
+            request.query_params.get('q', ''),
+        )[:limit]
+        serializer = RecipeSearchSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class PantrySearch(APIView):
+    """Recipes ranked by how much of them the given ingredients cover.
+
+    `GET ?ingredients=1&ingredients=2&order=missing&limit=20`, answered
+    from the in-memory `recipes.pantry` index plus one query for recipes.
+    """
+
+    def get(self, request, format=None):
+        serializer = PantrySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        query = serializer.validated_data
+        matches = pantry_index.search(query['ingredients'], query['order'],
+                                      limit=query['limit'])
+        recipes = Recipe.objects.select_related('author').only(
+            'pk', 'name', 'cook_time', 'image', 'author__username',
+        ).in_bulk([match.recipe_id for match in matches])
+        found = []
+        for match in matches:
+            recipe = recipes.get(match.recipe_id)
+            if recipe is not None:
+                recipe.pantry = match
+                found.append(recipe)
+        serializer = PantryRecipeSerializer(
+            found, many=True, context={'request': request}
+        )
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class UserState(APIView):
+    """Favourite, cart and follow marks of the current user.
+
+    `GET ?recipes=1&recipes=2&authors=3` returns which of the given
+    recipes are favourite or in the cart, which authors are followed and
+    the cart size. Pages render buttons in their default state and JS
+    sets them from this response, one set query per kind of mark.
+    """
+
+    def get(self, request, format=None):
+        serializer = UserStateSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data.get('recipes')
+        author_ids = serializer.validated_data.get('authors')
+        user = request.user
+        state = {
+            'favourites': [],
+            'purchases': [],
+            'following': [],
+            'purchases_count': request.cart.count,
+        }
+        if not user.is_authenticated:
+            return Response(state, status=status.HTTP_200_OK)
+
+        if recipe_ids:
+            state['favourites'] = list(
+                Favourite.objects
+                .filter(user=user, recipe_id__in=recipe_ids)
+                .values_list('recipe_id', flat=True)
+            )
+            state['purchases'] = list(
+                CartRecipe.objects
+                .filter(cart__owner=user, recipe_id__in=recipe_ids)
+                .values_list('recipe_id', flat=True)
+            )
+        if author_ids:
+            state['following'] = list(
+                Follow.objects
+                .filter(user=user, author_id__in=author_ids)
+                .values_list('author_id', flat=True)
+            )
+        return Response(state, status=status.HTTP_200_OK)
 
 
 class AddPurchase(APIView):
     def post(self, request, format=None):
-        cart = Cart.objects.get_or_create(
-            owner=request.user
-        )
-        CartRecipe.objects.get_or_create(
-            cart_id=cart[0].id,
-            recipe_id=request.data['id'],
+        _, created = CartRecipe.objects.get_or_create(
+            cart=request.cart.cart,
+            recipe_id=get_posted_id(request, Recipe.objects.all()),
         )
+        if created:
+            change_purchases_count(request.user.id, 1)
 
         return Response({'success': True}, status=status.HTTP_200_OK)
 
 
 class RemoveFromPurchases(APIView):
     def delete(self, request, pk, format=None):
-        cart = Cart.objects.get_or_create(
-            owner=request.user
-        )
-        c_r = CartRecipe.objects.all().count()
-        CartRecipe.objects.filter(recipe_id=pk, cart_id=cart[0].pk).delete()
-        if c_r > CartRecipe.objects.all().count():
+        deleted, _ = CartRecipe.objects.filter(
+            recipe_id=pk, cart__owner=request.user
+        ).delete()
+        if deleted:
+            change_purchases_count(request.user.id, -deleted)
             return Response({'success': True}, status=status.HTTP_200_OK)
         return Response({'success': False}, status=status.HTTP_404_NOT_FOUND)
+
+
+class BatchView(APIView):
+    """Add (POST) or remove (DELETE) many rows in one statement.
+
+    Payload is `{"ids": [...]}`, `{"author": id}` for all recipes of
+    an author or, on DELETE only, `{"all": true}`. Adding locks the
+    selected recipes, reads ids that are not linked yet and inserts them
+    with one `bulk_create`, removing is a single DELETE.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get_payload(self, request, adding):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        payload = serializer.validated_data
+        if adding and not (payload.get('ids') or payload.get('author')):
+            raise ValidationError('Нужно передать ids или author')
+        return payload
+
+    @staticmethod
+    def recipe_filter(payload, prefix=''):
+        """Q for recipes selected by payload, `prefix` is relation path."""
+        query = Q(**{f'{prefix}pk__in': payload.get('ids', [])})
+        if payload.get('author'):
+            query |= Q(**{f'{prefix}author_id': payload['author']})
+        return query
+
+    def lock_unlinked(self, payload, linked):
+        """Lock recipes selected by payload, return ids not in `linked`.
+
+        Must run in a transaction. A row referencing a locked recipe
+        can't be inserted by another transaction until this one ends,
+        so all returned ids are inserted by the caller and counters grow
+        by what was actually added.
+        """
+        locked = list(
+            Recipe.objects
+            .filter(self.recipe_filter(payload))
+            .order_by('pk')
+            .select_for_update()
+            .values_list('pk', flat=True)
+        )
+        present = set(linked.filter(recipe_id__in=locked)
+                      .values_list('recipe_id', flat=True))
+        return [pk for pk in locked if pk not in present]
+
+    def post(self, request, format=None):
+        added = self.add(request, self.get_payload(request, adding=True))
+        return Response({'success': True, 'added': added},
+                        status=status.HTTP_200_OK)
+
+    def delete(self, request, format=None):
+        removed = self.remove(request,
+                              self.get_payload(request, adding=False))
+        return Response({'success': True, 'removed': removed},
+                        status=status.HTTP_200_OK)
+
+
+class FavoritesBatch(BatchView):
+    """Add or remove many Recipes to/from User's Favorites."""
+
+    def add(self, request, payload):
+        with transaction.atomic():
+            recipe_ids = self.lock_unlinked(
+                payload, Favourite.objects.filter(user=request.user)
+            )
+            Favourite.objects.bulk_create(
+                [Favourite(user=request.user, recipe_id=recipe_id)
+                 for recipe_id in recipe_ids],
+                ignore_conflicts=True,
+            )
+            Recipe.objects.filter(
+                pk__in=recipe_ids
+            ).change_favourite_count(1)
+        return len(recipe_ids)
+
+    def remove(self, request, payload):
+        qs = Favourite.objects.filter(user=request.user)
+        if not payload['all']:
+            qs = qs.filter(self.recipe_filter(payload, 'recipe__'))
+        with transaction.atomic():
+            recipe_ids = list(
+                qs.select_for_update().values_list('recipe_id', flat=True)
+            )
+            deleted, _ = Favourite.objects.filter(
+                user=request.user, recipe_id__in=recipe_ids
+            ).delete()
+            Recipe.objects.filter(
+                pk__in=recipe_ids
+            ).change_favourite_count(-1)
+        return deleted
+
+
+class SubscriptionsBatch(BatchView):
+    """Follow or unfollow many authors, `ids` are author ids."""
+
+    def add(self, request, payload):
+        author_ids = list(
+            User.objects
+            .filter(pk__in=payload.get('ids', []))
+            .exclude(pk=request.user.pk)
+            .exclude(following__user=request.user)
+            .values_list('pk', flat=True)
+        )
+        Follow.objects.bulk_create(
+            [Follow(user=request.user, author_id=author_id)
+             for author_id in author_ids],
+            ignore_conflicts=True,
+        )
+        return len(author_ids)
+
+    def remove(self, request, payload):
+        qs = Follow.objects.filter(user=request.user)
+        if not payload['all']:
+            qs = qs.filter(author_id__in=payload.get('ids', []))
+        deleted, _ = qs.delete()
+        return deleted
+
+
+class PurchasesBatch(BatchView):
+    """Add or remove many Recipes to/from User's cart."""
+
+    def add(self, request, payload):
+        with transaction.atomic():
+            recipe_ids = self.lock_unlinked(
+                payload, CartRecipe.objects.filter(cart__owner=request.user)
+            )
+            if recipe_ids:
+                cart = request.cart.cart
+                CartRecipe.objects.bulk_create(
+                    [CartRecipe(cart=cart, recipe_id=recipe_id)
+                     for recipe_id in recipe_ids],
+                    ignore_conflicts=True,
+                )
+                change_purchases_count(request.user.id, len(recipe_ids))
+        return len(recipe_ids)
+
+    def remove(self, request, payload):
+        qs = CartRecipe.objects.filter(cart__owner=request.user)
+        if not payload['all']:
+            qs = qs.filter(self.recipe_filter(payload, 'recipe__'))
+        deleted, _ = qs.delete()
+        change_purchases_count(request.user.id, -deleted)
+        return deleted
@@ -0,0 +1,88 @@
+"""Versions for cached recipe card fragments.
+
+A card is cached under its recipe id and a version made of three
+tokens: one per recipe, one per author and one shared by all tags.
+Tokens live in the cache and are replaced by signals when a recipe, its
+tags or its author change, so stale fragments are never looked up again.
+The cache must be shared by all web processes (see `CACHES`), otherwise
+a change made in one process leaves the others serving old cards.
+
+A token records when it was bumped. A page read from a replica may not
+see that change yet for `PRIMARY_STICKY_SECONDS`, so its cards with
+such a fresh token are rendered without caching: an old card stored
+under the new token would be served for `RECIPE_CARD_CACHE_TIMEOUT`.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes import routers
+
+RECIPE_KEY = 'recipe_card_version:recipe:{}'
+AUTHOR_KEY = 'recipe_card_version:author:{}'
+TAGS_KEY = 'recipe_card_version:tags'
+
+
+def _token(bumped_at=0):
+    return f'{uuid.uuid4().hex}-{int(bumped_at)}'
+
+
+def _bumped_at(token) -> int:
+    _, _, bumped_at = token.partition('-')
+    return int(bumped_at or 0)
+
+
+def _bump(key):
+    """Replace a token once the change is visible to other processes."""
+    transaction.on_commit(
+        lambda: cache.set(key, _token(time.time()), None)
+    )
+
+
+def bump_recipe(recipe_id):
+    _bump(RECIPE_KEY.format(recipe_id))
+
+
+def bump_author(user_id):
+    _bump(AUTHOR_KEY.format(user_id))
+
+
+def bump_tags():
+    _bump(TAGS_KEY)
+
+
+def set_card_versions(recipes):
+    """Set `card_version` on recipes, one cache round trip if all known."""
+    recipes = list(recipes)
+    keys = {TAGS_KEY}
+    for recipe in recipes:
+        keys.add(RECIPE_KEY.format(recipe.pk))
+        keys.add(AUTHOR_KEY.format(recipe.author_id))
+    tokens = cache.get_many(keys)
+
+    missing = {key: _token() for key in keys - tokens.keys()}
+    if missing:
+        # `add` keeps a token stored meanwhile by another process
+        for key, token in missing.items():
+            cache.add(key, token, None)
+        missing.update(cache.get_many(missing))
+        tokens.update(missing)
+
+    fresh_after = 0
+    if routers.reading_from_replica():
+        fresh_after = time.time() - settings.PRIMARY_STICKY_SECONDS
+    for recipe in recipes:
+        version = (
+            tokens[RECIPE_KEY.format(recipe.pk)],
+            tokens[AUTHOR_KEY.format(recipe.author_id)],
+            tokens[TAGS_KEY],
+        )
+        if fresh_after and any(_bumped_at(token) > fresh_after
+                               for token in version):
+            # not cached, the template renders the card from `recipe`
+            recipe.card_version = None
+        else:
+            recipe.card_version = '.'.join(version)
@@ -0,0 +1,65 @@
+from functools import cached_property
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from recipes.models import Cart, CartRecipe
+
+PURCHASES_COUNT_KEY = 'purchases_count:{}'
+
+
+def get_purchases_count(user_id) -> int:
+    """Cart size from the cache, counted in DB only on a miss."""
+    key = PURCHASES_COUNT_KEY.format(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = (CartRecipe.objects.using(DEFAULT_DB_ALIAS)
+                 .filter(cart__owner_id=user_id).count())
+        cache.set(key, count, None)
+    return count
+
+
+def change_purchases_count(user_id, delta: int):
+    """Adjust cached cart size once the current transaction commits.
+
+    Every code path adding or removing CartRecipe rows must call it
+    (bulk operations send no signals). A missing counter is left alone
+    and will be counted on next read.
+    """
+    def apply():
+        try:
+            cache.incr(PURCHASES_COUNT_KEY.format(user_id), delta)
+        except ValueError:
+            pass
+
+    if delta:
+        transaction.on_commit(apply)
+
+
+def reset_purchases_count(user_ids):
+    """Drop cached cart sizes once the current transaction commits."""
+    keys = [PURCHASES_COUNT_KEY.format(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class CartSnapshot:
+    """Current user's cart, loaded lazily once per request.
+
+    Views and the `purchases` context processor share it as
+    `request.cart` (see `recipes.middleware.CartMiddleware`).
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def count(self) -> int:
+        if not self.user.is_authenticated:
+            return 0
+        return get_purchases_count(self.user.id)
+
+    @cached_property
+    def cart(self) -> Cart:
+        """Cart row itself, created on first use."""
+        return Cart.objects.get_or_create(owner=self.user)[0]
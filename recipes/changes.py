@@ -0,0 +1,36 @@
+"""One change event per transaction for edited recipes.
+
+Row signals of recipes, their ingredients and tags only record the
+recipe id with `touch`. After commit `recipes_changed` is sent once with
+all recorded ids, so an edit touching many rows refreshes search
+vectors, the pantry index and card caches once. Outside of a
+transaction the event is sent right away. Ids recorded in a rolled back
+transaction go out with the next event, refreshing them needlessly but
+harmlessly.
+"""
+import threading
+
+from django.db import transaction
+from django.dispatch import Signal
+
+# sent with `recipe_ids`, a sorted list of changed recipe ids
+recipes_changed = Signal()
+
+_pending = threading.local()
+
+
+def touch(recipe_ids):
+    """Record changed recipes, notify about them after commit."""
+    ids = getattr(_pending, 'ids', None)
+    if ids is None:
+        ids = _pending.ids = set()
+    ids.update(recipe_ids)
+    transaction.on_commit(_flush)
+
+
+def _flush():
+    ids = getattr(_pending, 'ids', None)
+    if not ids:
+        return
+    _pending.ids = None
+    recipes_changed.send(sender=None, recipe_ids=sorted(ids))
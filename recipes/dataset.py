@@ -0,0 +1,360 @@
+"""Synthetic dataset generator for load testing.
+
+Rows are generated from a seeded `random.Random` and written in
+batches: with `COPY ... FROM STDIN` on PostgreSQL and with
+`executemany` INSERTs on other backends. Both bypass model `save()`,
+so no signals are sent and `auto_now_add` fields take generated values.
+Search vectors and favourite counts of new recipes are then computed
+with one UPDATE each; image variants are made once per pooled image.
+On PostgreSQL the tables are analyzed afterwards.
+"""
+import csv
+import io
+import time
+from datetime import timedelta
+from itertools import accumulate, islice
+from random import Random
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image
+
+from recipes import thumbnails
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (Cart, CartRecipe, Favourite, Follow, Ingredient,
+                            Recipe, RecipeIngredient, RecipeTag, Tag, User)
+from recipes.pantry import pantry_index
+from recipes.search import update_search_vector
+
+DEFAULT_TAGS = (
+    ('breakfast', 'Завтрак', 'green'),
+    ('lunch', 'Обед', 'orange'),
+    ('dinner', 'Ужин', 'purple'),
+)
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'рагу', 'омлет', 'паста', 'плов',
+    'запеканка', 'блины', 'котлеты', 'соус', 'десерт', 'тушеный', 'жареный',
+    'домашний', 'быстрый', 'летний', 'острый', 'сливочный', 'овощной',
+)
+UNITS = ('г', 'мл', 'шт.', 'ст. л.', 'ч. л.')
+IMAGE_DIR = 'recipe_pictures/generated'
+IMAGE_SIZE = 480
+DISTRIBUTIONS = ('uniform', 'zipf')
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def insert_rows(model, fields, rows, batch_size):
+    """Insert raw rows into model table, return number of rows."""
+    meta = model._meta
+    model_fields = [meta.get_field(name) for name in fields]
+    columns = [field.column for field in model_fields]
+    # COPY reads an unquoted empty csv field as NULL, even for '' values
+    not_null = [field.column for field in model_fields
+                if field.empty_strings_allowed and not field.null]
+    copy_options = 'FORMAT csv'
+    if not_null:
+        copy_options += f', FORCE_NOT_NULL ({", ".join(not_null)})'
+    count = 0
+    with connection.cursor() as cursor:
+        for batch in batched(rows, batch_size):
+            batch = [
+                [field.get_db_prep_save(value, connection)
+                 for field, value in zip(model_fields, row)]
+                for row in batch
+            ]
+            if connection.vendor == 'postgresql':
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY {meta.db_table} ({", ".join(columns)}) '
+                    f'FROM STDIN WITH ({copy_options})',
+                    buffer,
+                )
+            else:
+                table = connection.ops.quote_name(meta.db_table)
+                quoted = ', '.join(map(connection.ops.quote_name, columns))
+                placeholders = ', '.join(['%s'] * len(columns))
+                cursor.executemany(
+                    f'INSERT INTO {table} ({quoted}) '
+                    f'VALUES ({placeholders})',
+                    batch,
+                )
+            count += len(batch)
+    return count
+
+
+class WeightedChoice:
+    """Pick values with uniform or Zipf-like popularity."""
+
+    def __init__(self, rng, values, distribution='uniform', exponent=1.1):
+        self.rng = rng
+        self.values = values
+        self.cum_weights = None
+        if distribution == 'zipf' and values:
+            ranks = list(range(1, len(values) + 1))
+            rng.shuffle(ranks)
+            self.cum_weights = list(accumulate(
+                rank ** -exponent for rank in ranks
+            ))
+
+    def pick(self, k=1):
+        return self.rng.choices(self.values, cum_weights=self.cum_weights,
+                                k=k)
+
+    def sample(self, k, exclude=None):
+        """Pick up to `k` distinct values, skipping `exclude`."""
+        k = min(k, len(self.values) - (exclude is not None))
+        picked = set()
+        for _ in range(k * 4):
+            if len(picked) >= k:
+                break
+            value = self.pick()[0]
+            if value != exclude:
+                picked.add(value)
+        return sorted(picked)
+
+
+class DatasetGenerator:
+    """Generate users, recipes and their relations in bulk.
+
+    `distribution` controls how authors, followed authors, favourite
+    and purchased recipes are picked: `uniform` or `zipf`, where a few
+    rows get most of the traffic as on a real site.
+    """
+
+    def __init__(self, seed=0, batch_size=10000, distribution='zipf',
+                 exponent=1.1, images=10, log=None):
+        self.rng = Random(seed)
+        self.batch_size = batch_size
+        self.distribution = distribution
+        self.exponent = exponent
+        self.images = images
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+
+    def choice(self, values):
+        return WeightedChoice(self.rng, values, self.distribution,
+                              self.exponent)
+
+    def per_user(self, average):
+        return self.rng.randint(0, 2 * average)
+
+    def _stage(self, name, model, fields, rows):
+        started = time.monotonic()
+        count = insert_rows(model, fields, rows, self.batch_size)
+        self.log(f'{name}: {count} rows in '
+                 f'{time.monotonic() - started:.1f}s')
+        return count
+
+    def _new_ids(self, queryset, since, *fields):
+        return list(queryset.filter(pk__gt=since)
+                    .order_by('pk').values_list('pk', *fields))
+
+    @staticmethod
+    def _max_pk(model):
+        last = model.objects.order_by('-pk').values_list('pk', flat=True)
+        return last.first() or 0
+
+    def image_pool(self):
+        """Create (once) a few shared images and return their names."""
+        names = []
+        for i in range(self.images):
+            name = f'{IMAGE_DIR}/{i}.jpg'
+            if not default_storage.exists(name):
+                palette = Random(i)
+                color = tuple(palette.randrange(256) for _ in range(3))
+                image = Image.new('RGB', (IMAGE_SIZE, IMAGE_SIZE), color)
+                content = io.BytesIO()
+                image.save(content, 'JPEG', quality=80)
+                name = default_storage.save(
+                    name, ContentFile(content.getvalue())
+                )
+            names.append(name)
+        return names or [Recipe._meta.get_field('image').default]
+
+    def tags(self):
+        for slug, name, color in DEFAULT_TAGS:
+            Tag.objects.get_or_create(slug=slug,
+                                      defaults={'name': name, 'color': color})
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def ingredients(self, count):
+        start = self._max_pk(Ingredient)
+        rows = (
+            (f'{self.rng.choice(WORDS)} {start + i}', self.rng.choice(UNITS))
+            for i in range(1, count + 1)
+        )
+        self._stage('ingredients', Ingredient, ('name', 'unit'), rows)
+        return list(Ingredient.objects.values_list('pk', flat=True))
+
+    def users(self, count):
+        start = self._max_pk(User)
+        password = make_password('Password1!')
+        rows = (
+            (f'user{start + i}', f'user{start + i}@example.com', password,
+             f'Имя{start + i}', f'Фамилия{start + i}',
+             False, False, True, self.now)
+            for i in range(1, count + 1)
+        )
+        self._stage('users', User, (
+            'username', 'email', 'password', 'first_name', 'last_name',
+            'is_superuser', 'is_staff', 'is_active', 'date_joined',
+        ), rows)
+        return [pk for pk, in self._new_ids(User.objects, start)]
+
+    def recipes(self, count, author_ids, days=365):
+        start = self._max_pk(Recipe)
+        authors = self.choice(author_ids)
+        images = self.image_pool()
+        rng = self.rng
+
+        def rows():
+            for _ in range(count):
+                name = ' '.join(rng.sample(WORDS, 2)).capitalize()
+                description = ' '.join(rng.choices(WORDS, k=40))
+                pub_date = self.now - timedelta(
+                    seconds=rng.randrange(days * 24 * 3600)
+                )
+                yield (name, authors.pick()[0], rng.randint(5, 180),
+                       description, pub_date, rng.choice(images), 0, '')
+
+        self._stage('recipes', Recipe, (
+            'name', 'author', 'cook_time', 'description', 'pub_date', 'image',
+            'favourite_count', 'thumbnails',
+        ), rows())
+        return self._new_ids(Recipe.objects, start, 'author_id')
+
+    def recipe_relations(self, recipe_ids, tag_ids, ingredient_ids,
+                         min_ingredients, max_ingredients):
+        rng = self.rng
+        tag_rows = (
+            (recipe_id, tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, rng.randint(1, len(tag_ids)))
+        )
+        self._stage('recipe tags', RecipeTag, ('recipe', 'tag'), tag_rows)
+
+        ingredient_rows = (
+            (recipe_id, ingredient_id, rng.randint(1, 500))
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(
+                ingredient_ids,
+                min(len(ingredient_ids),
+                    rng.randint(min_ingredients, max_ingredients)),
+            )
+        )
+        self._stage('recipe ingredients', RecipeIngredient,
+                    ('recipe', 'ingredient', 'amount'), ingredient_rows)
+
+    def search_vectors(self, since):
+        started = time.monotonic()
+        count = update_search_vector(
+            Recipe.objects.filter(pk__gt=since).values('pk')
+        )
+        self.log(f'search vectors: {count} rows in '
+                 f'{time.monotonic() - started:.1f}s')
+
+    def image_thumbnails(self, since):
+        """Generate variants of pooled images, mark new recipes."""
+        started = time.monotonic()
+        names = set(
+            Recipe.objects.filter(pk__gt=since)
+            .values_list('image', flat=True).distinct()
+        )
+        ready = []
+        for name in names:
+            try:
+                thumbnails.generate(name, default_storage)
+            except OSError:
+                continue
+            ready.append(name)
+        count = Recipe.objects.filter(
+            pk__gt=since, image__in=ready,
+        ).update(thumbnails=F('image'))
+        self.log(f'thumbnails: {count} rows in '
+                 f'{time.monotonic() - started:.1f}s')
+
+    def favourite_counts(self, since):
+        started = time.monotonic()
+        count = Recipe.objects.filter(pk__gt=since).sync_favourite_count()
+        self.log(f'favourite counts: {count} rows in '
+                 f'{time.monotonic() - started:.1f}s')
+
+    def user_relations(self, user_ids, author_ids, recipe_ids,
+                       follows, favourites, purchases):
+        authors = self.choice(author_ids)
+        recipes = self.choice(recipe_ids)
+
+        follow_rows = (
+            (user_id, author_id)
+            for user_id in user_ids
+            for author_id in authors.sample(self.per_user(follows),
+                                            exclude=user_id)
+        )
+        self._stage('follows', Follow, ('user', 'author'), follow_rows)
+
+        favourite_rows = (
+            (user_id, recipe_id)
+            for user_id in user_ids
+            for recipe_id in recipes.sample(self.per_user(favourites))
+        )
+        self._stage('favourites', Favourite, ('user', 'recipe'),
+                    favourite_rows)
+
+        start = self._max_pk(Cart)
+        self._stage('carts', Cart, ('owner',),
+                    ((user_id,) for user_id in user_ids))
+        cart_ids = self._new_ids(Cart.objects, start)
+        cart_rows = (
+            (cart_id, recipe_id)
+            for cart_id, in cart_ids
+            for recipe_id in recipes.sample(self.per_user(purchases))
+        )
+        self._stage('cart recipes', CartRecipe, ('cart', 'recipe'),
+                    cart_rows)
+
+    def generate(self, users=1000, recipes=10000, ingredients=0,
+                 follows=10, favourites=20, purchases=5,
+                 min_ingredients=3, max_ingredients=10):
+        """Generate the whole dataset in one transaction."""
+        with transaction.atomic():
+            tag_ids = self.tags()
+            first_recipe = self._max_pk(Recipe)
+            ingredient_ids = self.ingredients(ingredients)
+            # existing users may author the new recipes, but follows,
+            # favourites and carts are generated for new users only, so
+            # rows of earlier runs are never duplicated
+            user_ids = self.users(users)
+            recipe_rows = self.recipes(recipes, user_ids or list(
+                User.objects.values_list('pk', flat=True)
+            ))
+            recipe_ids = [pk for pk, _ in recipe_rows]
+            author_ids = sorted({author for _, author in recipe_rows})
+            self.recipe_relations(recipe_ids, tag_ids, ingredient_ids,
+                                  min_ingredients, max_ingredients)
+            self.search_vectors(since=first_recipe)
+            self.image_thumbnails(since=first_recipe)
+            self.user_relations(user_ids, author_ids, recipe_ids,
+                                follows, favourites, purchases)
+            self.favourite_counts(since=first_recipe)
+        if connection.vendor == 'postgresql':
+            # planner statistics of the loaded tables, autovacuum would
+            # collect them only later
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        pantry_index.invalidate()
+        if ingredients:
+            ingredient_index.invalidate()
@@ -0,0 +1,71 @@
+"""Duplicate relation rows that break the unique constraints.
+
+Of every group of rows with the same key the oldest one is kept. Rows
+are deleted with one `DELETE` per table that touches only the primary
+key and the key columns, so it works on a schema that `migrate` has
+not brought up to date yet. `remove_duplicates` runs before `migrate`
+applies migrations of `recipes` (see `recipes.signals`), the
+`remove_duplicates` command does the same by hand.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Min
+
+from recipes.cart import reset_purchases_count
+from recipes.models import (CartRecipe, Favourite, Follow, RecipeIngredient,
+                            RecipeTag)
+
+UNIQUE_ROWS = (
+    (RecipeIngredient, ('recipe', 'ingredient')),
+    (RecipeTag, ('recipe', 'tag')),
+    (Follow, ('user', 'author')),
+    (CartRecipe, ('cart', 'recipe')),
+    (Favourite, ('user', 'recipe')),
+)
+
+
+def duplicates(model, fields, using=DEFAULT_DB_ALIAS):
+    """Rows repeating the key of an older row."""
+    oldest = (model.objects
+              .using(using)
+              .values(*fields)
+              .annotate(oldest=Min('pk'))
+              .values('oldest'))
+    return model.objects.using(using).exclude(pk__in=oldest)
+
+
+def delete(model, rows, using=DEFAULT_DB_ALIAS) -> int:
+    """Delete `rows` of `model` without loading them, return the count."""
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    sql, params = rows.values('pk').query.sql_with_params()
+    with transaction.atomic(using=using):
+        owner_ids = []
+        if model is CartRecipe:
+            owner_ids = list(rows.values_list(
+                'cart__owner_id', flat=True
+            ).distinct())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(model._meta.db_table)} '
+                f'WHERE {quote(model._meta.pk.column)} IN ({sql})',
+                params,
+            )
+            deleted = cursor.rowcount
+        reset_purchases_count(owner_ids)
+    return deleted
+
+
+def remove_duplicates(using=DEFAULT_DB_ALIAS, dry_run=False):
+    """`{model: duplicates}` deleted, or only counted if `dry_run`.
+
+    Models whose table does not exist yet are skipped.
+    """
+    tables = set(connections[using].introspection.table_names())
+    counts = {}
+    for model, fields in UNIQUE_ROWS:
+        if model._meta.db_table not in tables:
+            continue
+        rows = duplicates(model, fields, using)
+        counts[model] = rows.count() if dry_run else delete(model, rows,
+                                                            using)
+    return counts
@@ -42,7 +42,9 @@ class RecipeIngredientFactory(factory.django.DjangoModelFactory):
 
     @factory.lazy_attribute
     def ingredient(self):
-        return choice(models.Ingredient.objects.all())
+        return choice(models.Ingredient.objects.exclude(
+            ingredient__recipe=self.recipe,
+        ))
 
 
 class RecipeFactory(BaseRecipeFactory):
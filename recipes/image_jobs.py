@@ -0,0 +1,139 @@
+"""Database-backed queue for recipe image processing.
+
+Saving a recipe only stores the upload and enqueues an `ImageJob`.
+`manage.py process_images` workers strip EXIF and generate variants
+(see `recipes.thumbnails`), pages show the placeholder image meanwhile.
+
+A worker claims a job with a conditional UPDATE that pushes its
+`run_after` past the visibility timeout, so no two workers take the
+same job and a job of a crashed worker becomes visible again once the
+timeout expires. Failed jobs are retried with exponential backoff
+until `IMAGE_JOB_MAX_ATTEMPTS`, then marked failed. Attempts are counted
+on claim, so a job whose worker keeps crashing on it (an image that
+gets the worker OOM-killed) is given up too.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from recipes import thumbnails
+from recipes.models import ImageJob, Recipe
+
+
+def enqueue(recipe) -> bool:
+    """Queue processing of recipe image unless done or already queued."""
+    name = recipe.image.name
+    if not name or recipe.thumbnails == name:
+        return False
+    queued = ImageJob.objects.filter(
+        recipe=recipe, image=name, status=ImageJob.PENDING,
+    ).exists()
+    if queued:
+        return False
+    ImageJob.objects.create(recipe=recipe, image=name)
+    return True
+
+
+def claim(limit: int, visibility_timeout=None, max_attempts=None):
+    """Take up to `limit` due jobs, hidden from other workers.
+
+    Due jobs that already used up their attempts are marked failed.
+    """
+    if visibility_timeout is None:
+        visibility_timeout = settings.IMAGE_JOB_VISIBILITY_TIMEOUT
+    if max_attempts is None:
+        max_attempts = settings.IMAGE_JOB_MAX_ATTEMPTS
+    now = timezone.now()
+    pending = ImageJob.objects.filter(status=ImageJob.PENDING,
+                                      run_after__lte=now)
+    pending.filter(attempts__gte=max_attempts).update(
+        status=ImageJob.FAILED, finished=now,
+        error=f'worker did not finish in {max_attempts} attempts',
+    )
+    due = (pending
+           .filter(attempts__lt=max_attempts)
+           .order_by('run_after')
+           .values_list('pk', 'run_after')[:limit])
+    hidden_until = now + timedelta(seconds=visibility_timeout)
+    claimed = [
+        pk for pk, run_after in due
+        if ImageJob.objects.filter(
+            pk=pk, status=ImageJob.PENDING, run_after=run_after,
+        ).update(run_after=hidden_until, attempts=F('attempts') + 1)
+    ]
+    return list(ImageJob.objects
+                .filter(pk__in=claimed)
+                .select_related('recipe')
+                .order_by('run_after', 'pk'))
+
+
+def run(job):
+    """Process a claimed job, skipping images replaced since queued."""
+    recipe = job.recipe
+    if recipe.image.name == job.image and recipe.thumbnails != job.image:
+        storage = recipe.image.storage
+        thumbnails.strip_metadata(job.image, storage)
+        thumbnails.generate(job.image, storage, force=True)
+        Recipe.objects.filter(
+            pk=recipe.pk, image=job.image,
+        ).update(thumbnails=job.image)
+    ImageJob.objects.filter(pk=job.pk).update(
+        status=ImageJob.DONE, finished=timezone.now(), error='',
+    )
+
+
+def fail(job, error, max_attempts=None, retry_delay=None) -> bool:
+    """Schedule a retry of a failed job, return False if given up."""
+    if max_attempts is None:
+        max_attempts = settings.IMAGE_JOB_MAX_ATTEMPTS
+    if retry_delay is None:
+        retry_delay = settings.IMAGE_JOB_RETRY_DELAY
+    now = timezone.now()
+    if job.attempts >= max_attempts:
+        changes = {'status': ImageJob.FAILED, 'finished': now}
+    else:
+        delay = retry_delay * 2 ** (job.attempts - 1)
+        changes = {'run_after': now + timedelta(seconds=delay)}
+    ImageJob.objects.filter(pk=job.pk).update(error=repr(error), **changes)
+    return job.attempts < max_attempts
+
+
+def prune(keep_days=None) -> int:
+    """Delete jobs finished more than `keep_days` ago."""
+    if keep_days is None:
+        keep_days = settings.IMAGE_JOB_KEEP_DAYS
+    deleted, _ = ImageJob.objects.filter(
+        finished__lt=timezone.now() - timedelta(days=keep_days),
+    ).delete()
+    return deleted
+
+
+def stats(window=timedelta(hours=1)):
+    """Queue depth by state and latencies of recently finished jobs.
+
+    `hidden` jobs are being processed or wait for a retry. Latency is
+    the time from enqueueing to finishing, in seconds.
+    """
+    now = timezone.now()
+    pending = ImageJob.objects.filter(status=ImageJob.PENDING)
+    counts = dict(ImageJob.objects.order_by()
+                  .values_list('status').annotate(Count('pk')))
+    oldest = pending.filter(run_after__lte=now).aggregate(
+        created=Min('created'),
+    )['created']
+    latencies = [
+        (finished - created).total_seconds()
+        for created, finished in ImageJob.objects.filter(
+            status=ImageJob.DONE, finished__gte=now - window,
+        ).values_list('created', 'finished')
+    ]
+    return {
+        'due': pending.filter(run_after__lte=now).count(),
+        'hidden': pending.filter(run_after__gt=now).count(),
+        'done': counts.get(ImageJob.DONE, 0),
+        'failed': counts.get(ImageJob.FAILED, 0),
+        'oldest_due_age': (now - oldest).total_seconds() if oldest else 0,
+        'latencies': latencies,
+    }
@@ -0,0 +1,132 @@
+import hashlib
+import heapq
+import json
+import threading
+import uuid
+from bisect import bisect_left
+from typing import NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from recipes.api.serializers import IngredientSerializer
+from recipes.models import Ingredient
+
+VERSION_CACHE_KEY = 'ingredient_index_version'
+
+# rank groups, lower is better
+EXACT, PREFIX, WORD_PREFIX, SUBSTRING = range(4)
+
+
+class _Snapshot(NamedTuple):
+    version: Optional[str]
+    digest: str
+    keys: Tuple[str, ...]
+    payloads: Tuple[str, ...]
+
+
+def normalize(text: str) -> str:
+    """Case-insensitive search key."""
+    return ' '.join(text.casefold().split())
+
+
+class IngredientIndex:
+    """Process-local index that serves ingredient autocomplete.
+
+    Ingredients are kept as a sorted array of normalized names with
+    pre-serialized JSON items next to them. Prefix matches are found
+    with a binary search, substring matches with a scan of the array.
+    The index is rebuilt lazily when the shared version stamp in the
+    cache changes (see `invalidate`).
+    """
+
+    def __init__(self, max_responses: int = 1024):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[_Snapshot] = None
+        self._responses = {}
+        self._max_responses = max_responses
+
+    def invalidate(self):
+        """Mark the index stale in every process sharing the cache."""
+        cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        self._snapshot = None
+
+    def _build(self, version: Optional[str]) -> _Snapshot:
+        items = IngredientSerializer(
+            Ingredient.objects.using(DEFAULT_DB_ALIAS), many=True,
+        ).data
+        rows = sorted(
+            (normalize(item['title']),
+             json.dumps(item, ensure_ascii=False, separators=(',', ':')))
+            for item in items
+        )
+        payloads = tuple(payload for _, payload in rows)
+        digest = hashlib.md5('\n'.join(payloads).encode()).hexdigest()
+        return _Snapshot(version, digest,
+                         tuple(key for key, _ in rows), payloads)
+
+    def get_snapshot(self) -> _Snapshot:
+        version = cache.get(VERSION_CACHE_KEY)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = self._build(version)
+                self._responses = {}
+                self._snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def _rank(snapshot: _Snapshot, query: str, limit: int):
+        keys = snapshot.keys
+        start = bisect_left(keys, query)
+        end = start
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+
+        ranked = []
+        for i in range(start, end):
+            group = EXACT if keys[i] == query else PREFIX
+            ranked.append((group, 0, len(keys[i]), i))
+        for i, key in enumerate(keys):
+            if start <= i < end:
+                continue
+            position = key.find(query)
+            if position == -1:
+                continue
+            if key[position - 1] in ' -(,':
+                group = WORD_PREFIX
+            else:
+                group = SUBSTRING
+            ranked.append((group, position, len(key), i))
+        return [i for *_, i in heapq.nsmallest(limit, ranked)]
+
+    def search(self, query: str, limit: Optional[int] = None):
+        """Return `(etag, body)` with matching ingredients as JSON."""
+        if limit is None:
+            limit = settings.INGREDIENTS_AUTOCOMPLETE_LIMIT
+        query = normalize(query)
+        snapshot = self.get_snapshot()
+        etag = '"{}"'.format(hashlib.md5(
+            f'{snapshot.digest}:{limit}:{query}'.encode()
+        ).hexdigest())
+
+        body = self._responses.get(etag)
+        if body is None:
+            if query:
+                found = self._rank(snapshot, query, limit)
+            else:
+                found = range(min(limit, len(snapshot.keys)))
+            body = '[{}]'.format(
+                ','.join(snapshot.payloads[i] for i in found)
+            ).encode()
+            if len(self._responses) >= self._max_responses:
+                self._responses = {}
+            self._responses[etag] = body
+        return etag, body
+
+
+ingredient_index = IngredientIndex()
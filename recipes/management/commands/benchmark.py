@@ -0,0 +1,404 @@
+import io
+import json
+import math
+import os
+import statistics
+import time
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.template.base import Template
+from django.test import Client
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from django.utils import timezone
+
+from recipes.dataset import DatasetGenerator
+from recipes.models import (Cart, CartRecipe, Follow, Recipe, RecipeIngredient,
+                            User)
+from recipes.pagination import encode_cursor
+
+BUDGETS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    'benchmark_budgets.json',
+)
+BATCH_SIZE = 10
+COLD = '_cold'
+# query counts do not vary between runs and are budgeted exactly; DB
+# time does, `--write-budgets` allows the baseline p95 times the margin
+DB_MS_MARGIN = 2
+DB_MS_FLOOR = 10
+DEEP_PAGE = 50
+SEARCH_QUERY = 'суп'
+# cold cases clear the cache, never the one shared with running servers
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+SIZES = {
+    'small': {'users': 50, 'recipes': 500},
+    'medium': {'users': 500, 'recipes': 5000},
+    'large': {'users': 5000, 'recipes': 100000},
+}
+
+
+@contextmanager
+def template_timer():
+    """Measure time spent in top-level `Template.render` calls."""
+    original = Template.render
+    state = {'depth': 0, 'total': 0.0}
+
+    def render(self, context):
+        state['depth'] += 1
+        started = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            state['depth'] -= 1
+            if not state['depth']:
+                state['total'] += time.perf_counter() - started
+
+    Template.render = render
+    try:
+        yield state
+    finally:
+        Template.render = original
+
+
+@contextmanager
+def query_timer():
+    """Count queries and measure their time at full timer precision."""
+    state = {'count': 0, 'total': 0.0}
+
+    def execute(run, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return run(sql, params, many, context)
+        finally:
+            state['count'] += 1
+            state['total'] += time.perf_counter() - started
+
+    with connection.execute_wrapper(execute):
+        yield state
+
+
+def percentiles(values):
+    if len(values) < 2:
+        values = values * 2
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return {
+        'p50': round(cuts[49], 3),
+        'p90': round(cuts[89], 3),
+        'p95': round(cuts[94], 3),
+        'p99': round(cuts[98], 3),
+        'mean': round(statistics.mean(values), 3),
+    }
+
+
+class Command(BaseCommand):
+    """Measure query count and latency of every view and API endpoint.
+
+    Each dataset size is generated in a fresh test database with
+    `recipes.dataset.DatasetGenerator`, so the working database is never
+    touched. Cases named `*_cold` run last, on an empty cache. Query
+    count, DB and template time are measured `--runs` times per case.
+    Their p95 is checked against `benchmark_budgets.json`, entries are
+    `{"queries": n, "db_ms": {vendor: ms}}` or a plain query count. The
+    command fails if any endpoint runs another number of queries than
+    budgeted or exceeds the DB time budget of the current database
+    vendor; DB time measured on one vendor says nothing about another,
+    vendors without a budget are not checked. `--write-budgets` stores
+    the measured counts and p95 DB time with a margin instead, keeping
+    DB time budgets of other vendors.
+    """
+    help = 'Benchmark views and API endpoints on generated datasets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='small,medium',
+                            help=f'comma separated: {", ".join(SIZES)}')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='timed requests per endpoint')
+        parser.add_argument('--runs', type=int, default=5,
+                            help='measured passes of query count and DB '
+                                 'time per endpoint')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--budgets', default=BUDGETS_PATH)
+        parser.add_argument('--write-budgets', action='store_true',
+                            help='replace budgets with measured query '
+                                 'counts and p95 DB time with a margin')
+        parser.add_argument('--output', default='benchmark.json',
+                            help='file for JSON results, `-` for stdout')
+
+    def handle(self, *args, **options):
+        sizes = options['sizes'].split(',')
+        unknown = set(sizes) - SIZES.keys()
+        if unknown:
+            raise CommandError(f'Unknown sizes: {", ".join(unknown)}')
+        with open(options['budgets'], encoding='utf-8') as file:
+            budgets = json.load(file)
+
+        report = {
+            'started': timezone.now().isoformat(),
+            'django': django.get_version(),
+            'vendor': connection.vendor,
+            'seed': options['seed'],
+            'repeat': options['repeat'],
+            'runs': options['runs'],
+            'results': {},
+            'failures': [],
+        }
+        setup_test_environment()
+        try:
+            # replicas would read the working database, not the test one
+            with override_settings(CACHES=LOCAL_CACHES, REPLICA_DATABASES=[]):
+                for size in sizes:
+                    report['results'][size] = self.run_size(
+                        size, options['seed'], options['repeat'],
+                        options['runs'],
+                    )
+        finally:
+            teardown_test_environment()
+
+        if options['write_budgets']:
+            budgets = self.baseline_budgets(report['results'],
+                                            connection.vendor, budgets)
+            with open(options['budgets'], 'w', encoding='utf-8') as file:
+                file.write(json.dumps(budgets, indent=2) + '\n')
+            self.stdout.write(f'Budgets written to {options["budgets"]}')
+        report['failures'] = self.check_budgets(report['results'], budgets,
+                                                connection.vendor)
+
+        dump = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output'] == '-':
+            self.stdout.write(dump)
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(dump)
+            self.stdout.write(f'Results written to {options["output"]}')
+        if report['failures']:
+            raise CommandError('Budget exceeded:\n' +
+                               '\n'.join(report['failures']))
+        self.stdout.write(self.style.SUCCESS('All endpoints within budget'))
+
+    @staticmethod
+    def check_budgets(results, budgets, vendor):
+        """Failure messages of endpoints off their budget.
+
+        Query counts must match exactly, so that a change of the count
+        either way shows up; DB time p95 may not exceed the budget of
+        `vendor`.
+        """
+        failures = []
+        for size, cases in results.items():
+            for name, result in cases.items():
+                budget = budgets.get(name)
+                if isinstance(budget, int):
+                    budget = {'queries': budget}
+                budget = budget or {}
+                queries = result['queries']['p95']
+                if 'queries' in budget and queries != budget['queries']:
+                    failures.append(f'{size}/{name}: queries p95 {queries}, '
+                                    f'budget {budget["queries"]}')
+                db_ms = result['db_ms']['p95']
+                limit = budget.get('db_ms', {}).get(vendor)
+                if limit is not None and db_ms > limit:
+                    failures.append(f'{size}/{name}: db_ms p95 {db_ms}, '
+                                    f'budget {limit} on {vendor}')
+        return failures
+
+    @staticmethod
+    def baseline_budgets(results, vendor, budgets):
+        """Budgets from the worst p95 of every endpoint over all sizes.
+
+        DB time budgets of vendors other than `vendor` are kept from
+        `budgets`.
+        """
+        baseline = {}
+        for cases in results.values():
+            for name, result in cases.items():
+                old = budgets.get(name)
+                db_ms = dict(old.get('db_ms', {})
+                             if isinstance(old, dict) else {})
+                budget = baseline.setdefault(
+                    name, {'queries': 0, 'db_ms': {**db_ms, vendor: 0}}
+                )
+                budget['queries'] = max(budget['queries'],
+                                        math.ceil(result['queries']['p95']))
+                budget['db_ms'][vendor] = max(
+                    budget['db_ms'][vendor], DB_MS_FLOOR,
+                    math.ceil(result['db_ms']['p95'] * DB_MS_MARGIN),
+                )
+        return baseline
+
+    def run_size(self, size, seed, repeat, runs):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            call_command('load_ingredients', stdout=io.StringIO())
+            DatasetGenerator(seed=seed, log=self.stdout.write).generate(
+                **SIZES[size]
+            )
+            call_command('compute_recommendations', stdout=io.StringIO())
+            self.stdout.write(f'{size}: dataset ready')
+            return self.run_cases(repeat, runs)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    @staticmethod
+    def cases(viewer):
+        """Yield `(name, method, url, data)` for every endpoint."""
+        recipe = Recipe.objects.exclude(author=viewer).first()
+        follow = Follow.objects.filter(user=viewer).first()
+        author = follow.author if follow else recipe.author
+
+        yield 'index', 'get', '/', None
+        yield 'index_tag', 'get', '/?tags=breakfast', None
+        yield 'index_popular', 'get', '/?order=popular', None
+        if settings.RECIPE_LIST_PAGINATION == 'cursor':
+            deep = Recipe.objects.order_by('-pub_date', '-pk').values_list(
+                'pub_date', 'pk')[DEEP_PAGE * settings.LIST_OBJECTS - 1]
+            query = urlencode({'cursor': encode_cursor(deep, False)})
+        else:
+            query = urlencode({'page': DEEP_PAGE})
+        yield 'index_deep', 'get', f'/?{query}', None
+        yield 'favourites', 'get', '/favourites/', None
+        yield 'recommendations', 'get', '/recommendations/', None
+        search = urlencode({'q': SEARCH_QUERY})
+        yield 'search', 'get', f'/search/?{search}', None
+        pantry = list(
+            RecipeIngredient.objects.filter(recipe=recipe)
+            .values_list('ingredient_id', 'ingredient__name')
+        )
+        names = urlencode({'ingredients': ','.join(n for _, n in pantry)})
+        yield 'pantry', 'get', f'/pantry/?{names}', None
+        yield 'profile', 'get', f'/profiles/{author.username}/', None
+        yield 'recipe', 'get', f'/recipes/{recipe.pk}/', None
+        yield 'subscriptions', 'get', '/subscriptions/', None
+        yield 'purchases', 'get', '/purchases/', None
+        for file_format in ('txt', 'csv', 'json'):
+            yield (f'download_{file_format}', 'get',
+                   f'/download/?format={file_format}', None)
+        yield 'api_ingredients', 'get', '/api/ingredients/?query=сол', None
+        yield 'api_search', 'get', f'/api/search/?{search}', None
+        ids = urlencode({'ingredients': [pk for pk, _ in pantry]}, doseq=True)
+        yield 'api_pantry', 'get', f'/api/pantry/?{ids}', None
+        state = urlencode({
+            'recipes': list(Recipe.objects.order_by('-pub_date', '-pk')
+                            .values_list('pk', flat=True)
+                            [:settings.LIST_OBJECTS]),
+            'authors': author.pk,
+        }, doseq=True)
+        yield 'api_state', 'get', f'/api/state/?{state}', None
+        yield ('api_favourites_add', 'post', '/api/favourites/',
+               {'id': recipe.pk})
+        yield ('api_favourites_remove', 'delete',
+               f'/api/favourites/{recipe.pk}/', None)
+        yield ('api_subscriptions_add', 'post', '/api/subscriptions/',
+               {'id': recipe.author_id})
+        yield ('api_subscriptions_remove', 'delete',
+               f'/api/subscriptions/{recipe.author_id}/', None)
+        yield ('api_purchases_add', 'post', '/api/purchases/',
+               {'id': recipe.pk})
+        yield ('api_purchases_remove', 'delete',
+               f'/api/purchases/{recipe.pk}/', None)
+        batch = {'ids': list(
+            Recipe.objects
+            .exclude(favourite_by__user=viewer)
+            .exclude(carts__cart__owner=viewer)
+            .values_list('pk', flat=True)[:BATCH_SIZE]
+        )}
+        yield ('api_favourites_batch_add', 'post',
+               '/api/favourites/batch/', batch)
+        yield ('api_favourites_batch_remove', 'delete',
+               '/api/favourites/batch/', batch)
+        yield ('api_purchases_batch_add', 'post',
+               '/api/purchases/batch/', batch)
+        yield ('api_purchases_batch_remove', 'delete',
+               '/api/purchases/batch/', batch)
+        yield 'index_cold', 'get', '/', None
+        yield 'recipe_cold', 'get', f'/recipes/{recipe.pk}/', None
+
+    def request(self, client, name, method, url, data):
+        if name.endswith(COLD):
+            cache.clear()
+        if data is None:
+            response = getattr(client, method)(url)
+        else:
+            response = getattr(client, method)(
+                url, json.dumps(data), content_type='application/json'
+            )
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    @staticmethod
+    def fill_cart(viewer):
+        """Put a recipe in an empty cart of `viewer`.
+
+        An empty list page skips its rows query, the purchases page
+        would run a number of queries depending on the dataset.
+        """
+        cart = Cart.objects.get_or_create(owner=viewer)[0]
+        if not cart.in_cart.exists():
+            CartRecipe.objects.create(
+                cart=cart,
+                recipe=Recipe.objects.exclude(author=viewer).last(),
+            )
+
+    def run_cases(self, repeat, runs):
+        viewer = (User.objects.annotate(n=Count('follower'))
+                  .order_by('-n', 'pk').first())
+        # counters cached for the previous dataset size are stale
+        cache.clear()
+        self.fill_cart(viewer)
+        cases = list(self.cases(viewer))
+        client = Client()
+        client.force_login(viewer)
+        warm = [case for case in cases if not case[0].endswith(COLD)]
+        cold = [case for case in cases if case[0].endswith(COLD)]
+        samples = {name: {'queries': [], 'db_ms': [], 'template_ms': []}
+                   for name, *_ in cases}
+        statuses = {}
+        # add/remove pairs run interleaved so that each request finds
+        # the state left by the previous one
+        for name, method, url, data in warm:
+            self.request(client, name, method, url, data)
+        for group in (warm, cold):
+            for _ in range(runs):
+                for name, method, url, data in group:
+                    with query_timer() as queries:
+                        with template_timer() as templates:
+                            response = self.request(client, name, method,
+                                                    url, data)
+                    statuses[name] = response.status_code
+                    samples[name]['queries'].append(queries['count'])
+                    samples[name]['db_ms'].append(1000 * queries['total'])
+                    samples[name]['template_ms'].append(
+                        1000 * templates['total']
+                    )
+        results = {
+            name: {'status': statuses[name], **{
+                metric: percentiles(values)
+                for metric, values in metrics.items()
+            }}
+            for name, metrics in samples.items()
+        }
+
+        timings = {name: [] for name, *_ in cases}
+        for group in (warm, cold):
+            for _ in range(repeat):
+                for name, method, url, data in group:
+                    started = time.perf_counter()
+                    self.request(client, name, method, url, data)
+                    timings[name].append(
+                        1000 * (time.perf_counter() - started)
+                    )
+        for name, values in timings.items():
+            results[name]['wall_ms'] = percentiles(values)
+        return results
@@ -0,0 +1,132 @@
+import json
+import time
+from random import Random
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Q
+
+from recipes.dataset import WeightedChoice
+from recipes.management.commands.benchmark import percentiles
+from recipes.models import Ingredient, Recipe
+from recipes.pantry import ORDERS, pantry_index
+
+
+class Command(BaseCommand):
+    """Measure pantry search on an in-memory or the current database.
+
+    By default a synthetic index of a million recipes is built in
+    memory, with Zipf-like ingredient popularity, so no database rows
+    are needed. `--from-db` uses the index of the current database
+    instead and `--sql` also times the same ranking done with joins.
+    """
+    help = 'Benchmark pantry search for pantries of different sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--min-ingredients', type=int, default=3)
+        parser.add_argument('--max-ingredients', type=int, default=10)
+        parser.add_argument('--sizes', default='5,10,20,50',
+                            help='comma separated pantry sizes')
+        parser.add_argument('--queries', type=int, default=50,
+                            help='pantries per size')
+        parser.add_argument('--order', choices=ORDERS, default=ORDERS[0])
+        parser.add_argument('--limit', type=int, default=120)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--from-db', action='store_true',
+                            help='index recipes of the current database')
+        parser.add_argument('--sql', action='store_true',
+                            help='compare with a JOIN query, needs --from-db')
+        parser.add_argument('--output', default='-',
+                            help='file for JSON results, `-` for stdout')
+
+    def handle(self, *args, **options):
+        rng = Random(options['seed'])
+        started = time.perf_counter()
+        if options['from_db']:
+            snapshot = pantry_index.get_snapshot()
+            ingredient_ids = list(
+                Ingredient.objects.values_list('pk', flat=True)
+            )
+        else:
+            ingredient_ids = list(range(1, options['ingredients'] + 1))
+            snapshot = pantry_index.build(self.rows(
+                rng, ingredient_ids, options['recipes'],
+                options['min_ingredients'], options['max_ingredients'],
+            ))
+        build_ms = 1000 * (time.perf_counter() - started)
+        postings = snapshot.postings.values()
+        report = {
+            'source': 'database' if options['from_db'] else 'synthetic',
+            'recipes': sum(1 for size in snapshot.sizes if size),
+            'postings': sum(len(ids) for ids in postings),
+            'memory_mb': round(
+                (sum(ids.buffer_info()[1] * ids.itemsize for ids in postings)
+                 + len(snapshot.sizes) * snapshot.sizes.itemsize) / 2 ** 20,
+                1,
+            ),
+            'build_ms': round(build_ms, 1),
+            'order': options['order'],
+            'limit': options['limit'],
+            'results': {},
+        }
+
+        ingredients = WeightedChoice(rng, ingredient_ids, 'zipf')
+        for size in map(int, options['sizes'].split(',')):
+            pantries = [ingredients.sample(size)
+                        for _ in range(options['queries'])]
+            result = {'index_ms': self.measure(
+                lambda pantry: pantry_index.search(
+                    pantry, options['order'], options['limit'], snapshot
+                ),
+                pantries,
+            )}
+            if options['sql'] and options['from_db']:
+                result['sql_ms'] = self.measure(
+                    lambda pantry: list(
+                        self.sql_search(pantry, options['limit'])
+                    ),
+                    pantries,
+                )
+            report['results'][size] = result
+            self.stdout.write(f'pantry of {size}: '
+                              f'p50 {result["index_ms"]["p50"]} ms')
+
+        dump = json.dumps(report, indent=2)
+        if options['output'] == '-':
+            self.stdout.write(dump)
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(dump)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+    @staticmethod
+    def rows(rng, ingredient_ids, recipes, min_ingredients, max_ingredients):
+        ingredients = WeightedChoice(rng, ingredient_ids, 'zipf')
+        for recipe_id in range(1, recipes + 1):
+            count = rng.randint(min_ingredients, max_ingredients)
+            for ingredient_id in set(ingredients.pick(count)):
+                yield ingredient_id, recipe_id
+
+    @staticmethod
+    def measure(search, pantries):
+        timings = []
+        for pantry in pantries:
+            started = time.perf_counter()
+            search(pantry)
+            timings.append(1000 * (time.perf_counter() - started))
+        return percentiles(timings)
+
+    @staticmethod
+    def sql_search(pantry, limit):
+        """Same `missing` ranking with joins over RecipeIngredient."""
+        return (
+            Recipe.objects
+            .annotate(
+                have=Count('recipe', filter=Q(recipe__ingredient__in=pantry)),
+                total=Count('recipe'),
+            )
+            .filter(have__gt=0)
+            .order_by(F('total') - F('have'), '-have', '-pk')
+            .values_list('pk', 'have', 'total')[:limit]
+        )
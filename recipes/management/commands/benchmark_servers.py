@@ -0,0 +1,216 @@
+import itertools
+import json
+import os
+import queue
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from recipes.management.commands.benchmark import percentiles
+from recipes.models import Ingredient, Recipe, User
+
+SERVERS = {
+    'wsgi': ('gunicorn', 'foodgram.wsgi:application', '--bind',
+             '127.0.0.1:{port}', '--workers', '{workers}'),
+    'asgi': ('uvicorn', 'foodgram.asgi:application', '--host', '127.0.0.1',
+             '--port', '{port}', '--workers', '{workers}',
+             '--no-access-log', '--log-level', 'warning'),
+}
+READY_TIMEOUT = 30
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    """Compare concurrent throughput of the WSGI and ASGI deployments.
+
+    Starts gunicorn with sync workers on `foodgram.wsgi` and uvicorn on
+    `foodgram.asgi`, with the same number of processes and the current
+    database, unless `--wsgi-url`/`--asgi-url` point to running servers.
+    Each concurrency level sends `--requests` scenarios from that many
+    client threads: ingredient autocomplete and, with `--username`,
+    add/remove pairs of favourites, subscriptions and purchases of
+    objects the user has not marked yet.
+    """
+    help = 'Benchmark WSGI and ASGI servers under concurrent requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', help='running WSGI server')
+        parser.add_argument('--asgi-url', help='running ASGI server')
+        parser.add_argument('--workers', type=int, default=2,
+                            help='processes of started servers')
+        parser.add_argument('--concurrency', default='1,8,32,64',
+                            help='comma separated client thread counts')
+        parser.add_argument('--requests', type=int, default=500,
+                            help='scenarios per concurrency level')
+        parser.add_argument('--username')
+        parser.add_argument('--password')
+        parser.add_argument('--output', default='-',
+                            help='file for JSON results, `-` for stdout')
+
+    def handle(self, *args, **options):
+        if options['username'] and not options['password']:
+            raise CommandError('--username needs --password')
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        targets = self.targets(options['username'])
+        report = {
+            'workers': options['workers'],
+            'requests': options['requests'],
+            'scenarios': sorted({name for name, _ in targets}),
+            'results': {},
+        }
+        for server in SERVERS:
+            url = options[f'{server}_url']
+            process = None
+            if url is None:
+                process, url = self.start(server, options['workers'])
+            try:
+                report['results'][server] = self.run_server(
+                    server, url.rstrip('/'), levels, targets, options,
+                )
+            finally:
+                if process is not None:
+                    process.terminate()
+                    process.wait()
+
+        dump = json.dumps(report, indent=2)
+        if options['output'] == '-':
+            self.stdout.write(dump)
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(dump)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+    @staticmethod
+    def targets(username):
+        """`(scenario, object id)` pairs cycled through by requests."""
+        prefixes = sorted({
+            name[:3].lower() for name in
+            Ingredient.objects.values_list('name', flat=True)[:200]
+        })
+        targets = [('ingredients', prefix) for prefix in prefixes]
+        if not username:
+            return targets
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            raise CommandError(f'Unknown user {username}')
+        recipes = Recipe.objects.exclude(author=user)
+        targets += [('favourites', pk) for pk in recipes.exclude(
+            favourite_by__user=user
+        ).values_list('pk', flat=True)[:1000]]
+        targets += [('purchases', pk) for pk in recipes.exclude(
+            carts__cart__owner=user
+        ).values_list('pk', flat=True)[:1000]]
+        targets += [('subscriptions', pk) for pk in User.objects.exclude(
+            pk=user.pk
+        ).exclude(following__user=user).values_list('pk', flat=True)[:1000]]
+        return targets
+
+    def start(self, server, workers):
+        port = free_port()
+        command = [sys.executable, '-m'] + [
+            part.format(port=port, workers=workers)
+            for part in SERVERS[server]
+        ]
+        process = subprocess.Popen(
+            command, cwd=settings.BASE_DIR, env=os.environ.copy(),
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        url = f'http://127.0.0.1:{port}'
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'{server} server exited:\n'
+                                   + process.stderr.read().decode())
+            try:
+                requests.get(f'{url}/api/ingredients/', timeout=5)
+            except requests.RequestException:
+                time.sleep(0.2)
+            else:
+                self.stdout.write(f'{server}: started {" ".join(command)}')
+                return process, url
+        process.terminate()
+        raise CommandError(f'{server} server did not start')
+
+    def login(self, url, username, password):
+        session = requests.Session()
+        if username:
+            login_url = url + reverse('login')
+            session.get(login_url)
+            response = session.post(login_url, data={
+                'username': username,
+                'password': password,
+                'csrfmiddlewaretoken': session.cookies.get('csrftoken'),
+            }, headers={'Referer': login_url}, allow_redirects=False)
+            if response.status_code != 302:
+                raise CommandError(f'Cannot log in as {username}')
+        return session
+
+    @staticmethod
+    def scenario(session, url, name, target):
+        """Send the requests of a scenario, return their timings."""
+        calls = []
+        if name == 'ingredients':
+            calls.append(('get', f'{url}/api/ingredients/?query={target}',
+                          None))
+        else:
+            calls.append(('post', f'{url}/api/{name}/', {'id': target}))
+            calls.append(('delete', f'{url}/api/{name}/{target}/', None))
+        headers = {'X-CSRFToken': session.cookies.get('csrftoken', '')}
+        timings = []
+        errors = 0
+        for method, call_url, data in calls:
+            started = time.perf_counter()
+            response = session.request(method, call_url, json=data,
+                                       headers=headers)
+            timings.append(1000 * (time.perf_counter() - started))
+            errors += response.status_code >= 400
+        return timings, errors
+
+    def run_server(self, server, url, levels, targets, options):
+        results = {}
+        sessions = queue.Queue()
+        for _ in range(max(levels)):
+            sessions.put(self.login(url, options['username'],
+                                    options['password']))
+        cycle = itertools.cycle(targets)
+
+        def task(target):
+            session = sessions.get()
+            try:
+                return self.scenario(session, url, *target)
+            finally:
+                sessions.put(session)
+
+        for level in levels:
+            batch = [next(cycle) for _ in range(options['requests'])]
+            with ThreadPoolExecutor(level) as pool:
+                list(pool.map(task, batch[:level]))
+                started = time.perf_counter()
+                outcomes = list(pool.map(task, batch))
+                elapsed = time.perf_counter() - started
+            timings = [ms for values, _ in outcomes for ms in values]
+            result = {
+                'rps': round(len(timings) / elapsed, 1),
+                'errors': sum(errors for _, errors in outcomes),
+                'latency_ms': percentiles(timings),
+            }
+            results[level] = result
+            self.stdout.write(
+                f'{server} x{level}: {result["rps"]} req/s, '
+                f'p50 {result["latency_ms"]["p50"]} ms, '
+                f'p99 {result["latency_ms"]["p99"]} ms, '
+                f'{result["errors"]} errors'
+            )
+        return results
@@ -0,0 +1,47 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from recipes import thumbnails
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Generate image variants of recipes that have none yet.
+
+    Variants are made once per distinct image, so recipes sharing an
+    image (e.g. the default one) cost a single resize. `--force` also
+    rewrites variants that already exist.
+    """
+    help = 'generate card, detail and mini variants of recipe images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='regenerate variants of all images')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only count images without variants')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['force']:
+            recipes = recipes.exclude(thumbnails=F('image'))
+        names = list(recipes.order_by().values_list('image', flat=True)
+                     .distinct())
+        self.stdout.write(f'images: {len(names)}')
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry run, nothing saved'))
+            return
+
+        written = failed = 0
+        for name in names:
+            try:
+                written += thumbnails.generate(name, default_storage,
+                                               force=options['force'])
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+                continue
+            Recipe.objects.filter(image=name).update(thumbnails=name)
+        self.stdout.write(f'variants written: {written}, failed images: '
+                          f'{failed}')
+        self.stdout.write(self.style.SUCCESS('Thumbnails updated'))
@@ -0,0 +1,165 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from recipes.models import (CartRecipe, Favourite, Follow, ImageJob,
+                            Ingredient, Recipe, RecipeIngredient, Tag, User)
+from recipes.search import search_recipes
+
+SEARCH_QUERY = 'суп'
+
+
+def first(queryset, default=1):
+    value = queryset.first()
+    return default if value is None else value
+
+
+def seq_scans(plan):
+    """Tables read with sequential scans anywhere in a JSON plan."""
+    found = []
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if node.get('Node Type') == 'Seq Scan':
+            found.append(node['Relation Name'])
+        nodes.extend(node.get('Plans', ()))
+    return found
+
+
+class Command(BaseCommand):
+    """Fail if querysets of the main pages scan whole tables.
+
+    Runs `EXPLAIN` for the querysets of recipe lists, the recipe page,
+    subscriptions, cart, user state and search on PostgreSQL. By
+    default `enable_seqscan` is off, so the planner picks a sequential
+    scan only when no index can serve the query, whatever the table
+    sizes. `--natural` keeps planner defaults and is meant for a seeded
+    database (`filldb --bulk`).
+    """
+    help = 'check that main page queries are served by indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--natural', action='store_true',
+                            help='keep planner defaults')
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='print every plan')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            raise CommandError('Query plans are checked on PostgreSQL only')
+
+        failures = []
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                if not options['natural']:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                for name, (sql, params) in self.cases(connection):
+                    cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                    plan = cursor.fetchone()[0]
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                    plan = plan[0]['Plan']
+                    if options['verbose_plans']:
+                        self.stdout.write(f'{name}:\n'
+                                          f'{json.dumps(plan, indent=2)}')
+                    tables = seq_scans(plan)
+                    if tables:
+                        failures.append(f'{name}: {", ".join(tables)}')
+                        self.stdout.write(self.style.ERROR(
+                            f'{name}: seq scan of {", ".join(tables)}'
+                        ))
+                    else:
+                        self.stdout.write(f'{name}: ok')
+        if failures:
+            raise CommandError('Sequential scans found:\n'
+                               + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('All plans use indexes'))
+
+    @staticmethod
+    def cases(connection):
+        """Yield `(name, (sql, params))` of checked queries."""
+        user_id = first(Favourite.objects.values_list('user_id', flat=True))
+        follower_id = first(Follow.objects.values_list('user_id', flat=True))
+        owner_id = first(
+            CartRecipe.objects.values_list('cart__owner_id', flat=True)
+        )
+        author_id = first(Recipe.objects.values_list('author_id', flat=True))
+        recipe = Recipe.objects.only('pk', 'pub_date').first()
+        recipe_id = recipe.pk if recipe else 1
+        pub_date = recipe.pub_date if recipe else timezone.now()
+        tag_slug = first(Tag.objects.values_list('slug', flat=True), 'tag')
+        ingredient = first(Ingredient.objects.values_list('name', flat=True),
+                           'соль')
+        recipe_ids = list(
+            Recipe.objects.values_list('pk', flat=True)[:settings.LIST_OBJECTS]
+        ) or [recipe_id]
+        page = settings.LIST_OBJECTS + 1
+
+        cards = Recipe.objects.for_cards()
+        by_date = ('-pub_date', '-pk')
+        querysets = {
+            'index': cards.order_by(*by_date)[:page],
+            'index_deep': cards.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, pk__lt=recipe_id)
+            ).order_by(*by_date)[:page],
+            'index_popular': cards.order_by(
+                '-favourite_count', *by_date
+            )[:page],
+            'index_tag': cards.with_tags([tag_slug]).order_by(*by_date)[:page],
+            'profile': cards.filter(
+                author_id=author_id
+            ).order_by(*by_date)[:page],
+            'profile_popular': cards.filter(
+                author_id=author_id
+            ).order_by('-favourite_count', *by_date)[:page],
+            'favourites': cards.filter(
+                favourite_by__user_id=user_id
+            ).order_by(*by_date)[:page],
+            'card_tags': Tag.objects.filter(tags__recipe_id__in=recipe_ids),
+            'recipe': Recipe.objects.for_detail().filter(pk=recipe_id),
+            'recipe_ingredients': RecipeIngredient.objects.filter(
+                recipe_id=recipe_id
+            ).select_related('ingredient'),
+            'neighbours': Recipe.objects.neighbours_of(recipe_id)[:4],
+            'recommendations': cards.recommended_for(
+                user_id
+            ).order_by('-score', '-pk')[:page],
+            'subscriptions': User.objects.filter(
+                following__user_id=follower_id
+            ).order_by('username')[:3],
+            'cart': Recipe.objects.filter(
+                carts__cart__owner_id=owner_id
+            ).order_by(*by_date)[:page],
+            'state_favourites': Favourite.objects.filter(
+                user_id=user_id, recipe_id__in=recipe_ids,
+            ).values_list('recipe_id'),
+            'state_cart': CartRecipe.objects.filter(
+                cart__owner_id=owner_id, recipe_id__in=recipe_ids,
+            ).values_list('recipe_id'),
+            'state_follows': Follow.objects.filter(
+                user_id=follower_id, author_id__in=[author_id],
+            ).values_list('author_id'),
+            'search': search_recipes(Recipe.objects.all(),
+                                     SEARCH_QUERY)[:page],
+            'ingredient_names': Ingredient.objects.filter(name=ingredient),
+            'ingredient_prefix': Ingredient.objects.filter(
+                name__startswith=ingredient[:3],
+            ),
+            'image_queue': ImageJob.objects.filter(
+                status=ImageJob.PENDING, run_after__lte=timezone.now(),
+            ).order_by('run_after')[:10],
+        }
+        for name, queryset in querysets.items():
+            yield name, queryset.query.get_compiler(
+                connection=connection
+            ).as_sql()
+
+        latest = Recipe.objects.latest_per_author([author_id], 3)
+        yield 'subscriptions_recipes', (latest.raw_query, latest.params)
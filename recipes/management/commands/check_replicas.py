@@ -0,0 +1,143 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+
+from recipes import card_cache, routers
+from recipes.middleware import PRIMARY_COOKIE
+from recipes.models import Recipe, User
+
+
+class Command(BaseCommand):
+    """Check which database alias serves reads and writes of requests.
+
+    Needs at least one alias in `REPLICA_DATABASES`; it may point to the
+    primary itself, only the alias used by each query is checked.
+    Requests a page anonymously, adds and removes a favourite of
+    `--username` through the API and checks that pages go to a replica,
+    writes and the sticky window to the primary, and that recipe cards
+    with a token fresher than the window are not cached from a replica.
+    """
+    help = 'check replica routing and read-your-writes stickiness'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username',
+                            help='user to log in, the first one by default')
+
+    def handle(self, *args, **options):
+        if not settings.REPLICA_DATABASES:
+            raise CommandError('No replicas, set DB_REPLICA_HOSTS or '
+                               'REPLICA_DATABASES')
+        users = User.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+        if options['username']:
+            users = users.filter(username=options['username'])
+        user = users.first()
+        recipe = (Recipe.objects.using(DEFAULT_DB_ALIAS)
+                  .exclude(favourite_by__user=user).first())
+        if user is None or recipe is None:
+            raise CommandError('Needs a user and a recipe, run filldb')
+
+        self.failures = []
+        setup_test_environment()
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                self.check_requests(user, recipe)
+            self.check_card_versions(recipe)
+        finally:
+            teardown_test_environment()
+        if self.failures:
+            raise CommandError('Routing failed:\n' + '\n'.join(self.failures))
+        self.stdout.write(self.style.SUCCESS('Replica routing works'))
+
+    def expect(self, name, ok):
+        if ok:
+            self.stdout.write(f'{name}: ok')
+        else:
+            self.failures.append(name)
+            self.stdout.write(self.style.ERROR(f'{name}: failed'))
+
+    @staticmethod
+    def request(client, method, *args, **kwargs):
+        """Send a request, return it with `{alias: [sql]}` it ran."""
+        contexts = {alias: CaptureQueriesContext(connections[alias])
+                    for alias in connections}
+        for context in contexts.values():
+            context.__enter__()
+        try:
+            response = getattr(client, method)(*args, **kwargs)
+        finally:
+            for context in contexts.values():
+                context.__exit__(None, None, None)
+        return response, {
+            alias: [query['sql'] for query in context.captured_queries]
+            for alias, context in contexts.items()
+        }
+
+    @staticmethod
+    def on_replicas(queries):
+        return sum(len(queries[alias])
+                   for alias in settings.REPLICA_DATABASES)
+
+    @staticmethod
+    def primary_reads_sessions_only(queries):
+        """No model but those of `routers.PRIMARY_APPS` read from primary."""
+        tables = [
+            connections[DEFAULT_DB_ALIAS].ops.quote_name(model._meta.db_table)
+            for model in apps.get_models()
+            if model._meta.app_label not in routers.PRIMARY_APPS
+        ]
+        return not any(table in sql for sql in queries[DEFAULT_DB_ALIAS]
+                       for table in tables)
+
+    def check_requests(self, user, recipe):
+        client = Client()
+        _, queries = self.request(client, 'get', '/')
+        self.expect('anonymous page reads a replica',
+                    self.on_replicas(queries)
+                    and self.primary_reads_sessions_only(queries))
+
+        client.force_login(user)
+        _, queries = self.request(client, 'get', '/')
+        self.expect('logged in page reads a replica, sessions the primary',
+                    self.on_replicas(queries)
+                    and self.primary_reads_sessions_only(queries))
+
+        response, queries = self.request(
+            client, 'post', '/api/favourites/', {'id': recipe.pk},
+            content_type='application/json',
+        )
+        self.expect('write goes to the primary',
+                    response.status_code == 200
+                    and not self.on_replicas(queries)
+                    and PRIMARY_COOKIE in response.cookies)
+
+        _, queries = self.request(client, 'get', '/')
+        self.expect('pages within the sticky window read the primary',
+                    not self.on_replicas(queries))
+
+        response, _ = self.request(client, 'delete',
+                                   f'/api/favourites/{recipe.pk}/')
+        self.expect('favourite removed', response.status_code == 200)
+
+        client.cookies.pop(PRIMARY_COOKIE, None)
+        _, queries = self.request(client, 'get', '/')
+        self.expect('pages after the sticky window read a replica',
+                    self.on_replicas(queries))
+
+    def check_card_versions(self, recipe):
+        card_cache.bump_recipe(recipe.pk)
+        token = routers.read_from_replica()
+        try:
+            card_cache.set_card_versions([recipe])
+        finally:
+            routers.reset(token)
+        self.expect('fresh card from a replica is not cached',
+                    recipe.card_version is None)
+
+        card_cache.set_card_versions([recipe])
+        self.expect('fresh card from the primary is cached',
+                    recipe.card_version is not None)
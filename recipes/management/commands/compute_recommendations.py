@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes import recommendations
+
+
+class Command(BaseCommand):
+    """Precompute "also favourited" neighbours of every recipe.
+
+    Reads the whole favourites matrix, computes item-item cosine
+    similarity with sparse matrix products and replaces the stored
+    top-K lists in one transaction. Meant to run periodically, e.g.
+    nightly from cron; pages only read the stored lists.
+    """
+    help = 'compute recipe neighbours from favourites'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--neighbours', type=int,
+                            default=recommendations.NEIGHBOURS,
+                            help='neighbours kept per recipe')
+        parser.add_argument('--min-support', type=int,
+                            default=recommendations.MIN_SUPPORT,
+                            help='min users favouriting both recipes')
+        parser.add_argument('--block-size', type=int,
+                            default=recommendations.BLOCK_SIZE,
+                            help='recipes per sparse matrix product')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='compute and report without saving')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        user_ids, recipe_ids = recommendations.load_favourites()
+        self.stdout.write(f'favourites: {len(recipe_ids)} '
+                          f'({time.monotonic() - started:.1f}s)')
+
+        started = time.monotonic()
+        neighbours = recommendations.item_neighbours(
+            user_ids, recipe_ids,
+            k=options['neighbours'],
+            min_support=options['min_support'],
+            block_size=options['block_size'],
+        )
+        self.stdout.write(
+            f'neighbours: {len(neighbours.scores)} of '
+            f'{len(set(neighbours.recipe_ids.tolist()))} recipes '
+            f'({time.monotonic() - started:.1f}s)'
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry run, nothing saved'))
+            return
+
+        started = time.monotonic()
+        with transaction.atomic():
+            stored = recommendations.store_neighbours(neighbours)
+        self.stdout.write(f'stored: {stored} '
+                          f'({time.monotonic() - started:.1f}s)')
+        self.stdout.write(self.style.SUCCESS('Recommendations updated'))
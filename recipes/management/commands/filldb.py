@@ -2,6 +2,7 @@ from random import randint, sample
 
 from django.core.management.base import BaseCommand
 
+from recipes.dataset import DISTRIBUTIONS, DatasetGenerator
 from recipes.factories import RecipeFactory
 from recipes.models import Favourite, Recipe, User
 
@@ -16,10 +17,43 @@ class Command(BaseCommand):
     Django commands docs:
     https://docs.djangoproject.com/en/3.1/howto/custom-management-commands/
 
+    Without `--bulk` recipes are created with factories for existing
+    users. With `--bulk` a seeded synthetic dataset of any size is
+    generated with batched inserts, see `recipes.dataset`.
     """
     help = 'Fill DB with sample data'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--bulk', action='store_true',
+                            help='generate a large dataset with bulk inserts')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients', type=int, default=0,
+                            help='synthetic ingredients to add to catalog')
+        parser.add_argument('--min-ingredients', type=int, default=3,
+                            help='min ingredients per recipe')
+        parser.add_argument('--max-ingredients', type=int, default=10,
+                            help='max ingredients per recipe')
+        parser.add_argument('--follows', type=int, default=10,
+                            help='average follows per user')
+        parser.add_argument('--favourites', type=int, default=20,
+                            help='average favourites per user')
+        parser.add_argument('--purchases', type=int, default=5,
+                            help='average cart recipes per user')
+        parser.add_argument('--distribution', choices=DISTRIBUTIONS,
+                            default='zipf',
+                            help='popularity of authors and recipes')
+        parser.add_argument('--exponent', type=float, default=1.1,
+                            help='zipf distribution exponent')
+        parser.add_argument('--images', type=int, default=10,
+                            help='size of shared image pool')
+        parser.add_argument('--batch-size', type=int, default=10000)
+
     def handle(self, *args, **options):
+        if options['bulk']:
+            return self.generate(options)
+
         users = User.objects.all()
 
         for user in users:
@@ -33,3 +67,24 @@ class Command(BaseCommand):
             Favourite.objects.bulk_create([
                 Favourite(user=user, recipe=recipe) for recipe in to_favorite
             ])
+
+    def generate(self, options):
+        generator = DatasetGenerator(
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            distribution=options['distribution'],
+            exponent=options['exponent'],
+            images=options['images'],
+            log=self.stdout.write,
+        )
+        generator.generate(
+            users=options['users'],
+            recipes=options['recipes'],
+            ingredients=options['ingredients'],
+            follows=options['follows'],
+            favourites=options['favourites'],
+            purchases=options['purchases'],
+            min_ingredients=options['min_ingredients'],
+            max_ingredients=options['max_ingredients'],
+        )
+        self.stdout.write(self.style.SUCCESS('Dataset generated'))
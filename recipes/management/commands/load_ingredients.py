@@ -1,20 +1,121 @@
 import csv
 import os
+from collections import Counter
 
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 from foodgram.settings import BASE_DIR
-from recipes.models import Ingredient
+from recipes.ingredient_index import ingredient_index, normalize
+from recipes.models import Ingredient, RecipeIngredient
+from recipes.search import update_search_vector
 
 CSV_FILE_PATH = os.path.join(BASE_DIR, 'ingredients.csv')
+BATCH_SIZE = 1000
+
+
+class DryRun(Exception):
+    """Raised to roll back the sync transaction."""
 
 
 class Command(BaseCommand):
+    """Sync ingredient catalog with a CSV file of `name,unit` rows.
+
+    An ingredient is identified by its name and unit, the same name
+    may come with several units. Existing ingredients are read once, new
+    ones are inserted in batches, renames that differ only in case or
+    spacing are updated in place, refreshing search vectors of recipes
+    using them. Ingredients missing from the file are reported but never
+    deleted, as recipes may still reference them.
+    """
     help = 'load ingredients to db'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=CSV_FILE_PATH,
+                            help='CSV file with `name,unit` rows')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='rows per INSERT/UPDATE statement')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='report changes without saving them')
+
     def handle(self, *args, **options):
-        with open(CSV_FILE_PATH) as file:
-            reader = csv.reader(file)
-            for row in reader:
-                name, unit = row
-                Ingredient.objects.get_or_create(name=name, unit=unit)
+        batch_size = options['batch_size']
+        try:
+            with transaction.atomic():
+                stats = self.sync(options['file'], batch_size)
+                if options['dry_run']:
+                    raise DryRun
+        except DryRun:
+            self.report(stats)
+            self.stdout.write(self.style.WARNING('Dry run, nothing saved'))
+        else:
+            ingredient_index.invalidate()
+            self.report(stats)
+            self.stdout.write(self.style.SUCCESS('Ingredients synced'))
+
+    def sync(self, path, batch_size):
+        stats = Counter()
+        existing = {}
+        by_key = {}
+        total = 0
+        for ingredient in (Ingredient.objects.only('pk', 'name', 'unit')
+                           .order_by('pk')):
+            total += 1
+            existing.setdefault((ingredient.name, ingredient.unit),
+                                ingredient)
+            by_key.setdefault((normalize(ingredient.name), ingredient.unit),
+                              ingredient)
+
+        seen = set()
+        matched = set()
+        to_create = []
+        to_update = []
+        renamed = []
+        with open(path, encoding='utf-8', newline='') as file:
+            for row in csv.reader(file):
+                if len(row) != 2 or not row[0].strip():
+                    stats['invalid'] += 1
+                    continue
+                name, unit = (value.strip() for value in row)
+                if (name, unit) in seen:
+                    stats['duplicates'] += 1
+                    continue
+                seen.add((name, unit))
+
+                ingredient = (existing.get((name, unit))
+                              or by_key.get((normalize(name), unit)))
+                if ingredient is None or ingredient.pk in matched:
+                    to_create.append(Ingredient(name=name, unit=unit))
+                    stats['created'] += 1
+                    if len(to_create) >= batch_size:
+                        Ingredient.objects.bulk_create(to_create)
+                        to_create = []
+                    continue
+                matched.add(ingredient.pk)
+
+                if ingredient.name != name:
+                    ingredient.name = name
+                    renamed.append(ingredient.pk)
+                    to_update.append(ingredient)
+                    stats['renamed'] += 1
+                else:
+                    stats['unchanged'] += 1
+
+        Ingredient.objects.bulk_create(to_create)
+        Ingredient.objects.bulk_update(to_update, ['name'],
+                                       batch_size=batch_size)
+        # bulk_update sends no signals, see reindex_ingredient_recipes
+        if renamed:
+            stats['recipes reindexed'] = update_search_vector(
+                RecipeIngredient.objects
+                .filter(ingredient_id__in=renamed)
+                .values('recipe_id')
+            )
+        stats['missing from file'] = total - len(matched)
+        return stats
+
+    def report(self, stats):
+        for key in ('created', 'renamed', 'unchanged',
+                    'missing from file', 'duplicates', 'invalid',
+                    'recipes reindexed'):
+            self.stdout.write(f'{key}: {stats[key]}')
@@ -0,0 +1,77 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes import image_jobs
+from recipes.management.commands.benchmark import percentiles
+
+
+class Command(BaseCommand):
+    """Worker processing queued recipe images, see `recipes.image_jobs`.
+
+    Runs until stopped, polling the queue when it is empty. Any number
+    of workers may run at once. `--stats` prints queue depth and job
+    latency as JSON instead, e.g. for monitoring.
+    """
+    help = 'process queued recipe images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10,
+                            help='jobs claimed at once')
+        parser.add_argument('--poll-interval', type=float, default=5,
+                            help='seconds to wait when the queue is empty')
+        parser.add_argument('--visibility-timeout', type=int,
+                            default=settings.IMAGE_JOB_VISIBILITY_TIMEOUT,
+                            help='seconds a claimed job stays hidden')
+        parser.add_argument('--once', action='store_true',
+                            help='exit when no jobs are due')
+        parser.add_argument('--stats', action='store_true',
+                            help='print queue metrics and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.print_stats()
+            return
+
+        pruned = False
+        while True:
+            jobs = image_jobs.claim(options['batch_size'],
+                                    options['visibility_timeout'])
+            if not jobs:
+                if not pruned:
+                    image_jobs.prune()
+                    pruned = True
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+            pruned = False
+            for job in jobs:
+                self.process(job)
+
+    def process(self, job):
+        started = time.monotonic()
+        try:
+            image_jobs.run(job)
+        except Exception as error:
+            retried = image_jobs.fail(job, error)
+            self.stderr.write(
+                f'{job.image}: attempt {job.attempts} failed, '
+                f'{"will retry" if retried else "giving up"}: {error!r}'
+            )
+            return
+        self.stdout.write(
+            f'{job.image}: {time.monotonic() - started:.2f}s, '
+            f'latency {(timezone.now() - job.created).total_seconds():.1f}s'
+        )
+
+    def print_stats(self):
+        stats = image_jobs.stats()
+        latencies = stats.pop('latencies')
+        stats['finished_last_hour'] = len(latencies)
+        if latencies:
+            stats['latency'] = percentiles(latencies)
+        self.stdout.write(json.dumps(stats, indent=2))
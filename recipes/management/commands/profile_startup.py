@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Recipe, RecipeIngredient
+
+IMPORT_PREFIX = 'import time:'
+MARKER = 'profile_startup:'
+PROFILER = 'profiler'
+STARTUP = 'startup'
+
+
+def parse_imports(lines):
+    """`{phase: [(module, self_us, cumulative_us, depth)]}` of `-X importtime`.
+
+    Phases are split by marker lines, imports before the first marker
+    belong to `startup`.
+    """
+    phases = defaultdict(list)
+    phase = STARTUP
+    for line in lines:
+        if line.startswith(MARKER):
+            phase = line[len(MARKER):].split()[0]
+            continue
+        if not line.startswith(IMPORT_PREFIX) or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len(IMPORT_PREFIX):].split('|', 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        phases[phase].append((name.strip(), int(own), int(cumulative), depth))
+    return phases
+
+
+def summarize(imports, top):
+    """Total, per package and slowest modules of an import phase."""
+    packages = defaultdict(int)
+    for name, own, _, _ in imports:
+        packages[name.split('.')[0]] += own
+    slowest = sorted(imports, key=lambda row: row[2], reverse=True)[:top]
+    return {
+        'modules': len(imports),
+        'total_ms': round(sum(own for _, own, _, _ in imports) / 1000, 1),
+        'packages_ms': {
+            name: round(own / 1000, 1) for name, own in sorted(
+                packages.items(), key=lambda item: item[1], reverse=True,
+            )[:top]
+        },
+        'slowest_ms': {
+            name: round(cumulative / 1000, 1)
+            for name, _, cumulative, _ in slowest
+        },
+    }
+
+
+class Command(BaseCommand):
+    """Report import time and first-request latency of a fresh process.
+
+    Runs this command again in a new interpreter with `-X importtime`,
+    once cold and once after `recipes.warmup`. The child requests every
+    probed page twice with the test client. Reported per process are
+    the time to a ready command, import time per package and module,
+    and per page the first and the next request latency with the
+    modules imported by the first one. Save results with `--output` to
+    track cold-start regressions.
+    """
+    help = 'Profile imports and first requests of a cold worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15,
+                            help='packages and modules listed per phase')
+        parser.add_argument('--output', default='-',
+                            help='file for JSON results, `-` for stdout')
+        parser.add_argument('--child', action='store_true',
+                            help=argparse.SUPPRESS)
+        parser.add_argument('--warm-up', action='store_true',
+                            help=argparse.SUPPRESS)
+        parser.add_argument('--probe', action='append', default=[],
+                            help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['child']:
+            return self.child(options)
+
+        probes = self.probes()
+        report = {'python': sys.version.split()[0], 'results': {}}
+        for mode in ('cold', 'warm_up'):
+            result = self.run_child(probes, mode == 'warm_up', options['top'])
+            report['results'][mode] = result
+            self.stdout.write(
+                f'{mode}: ready in {result["ready_ms"]} ms, '
+                f'imports {result["imports"][STARTUP]["total_ms"]} ms'
+            )
+            for name, probe in result['requests'].items():
+                self.stdout.write(
+                    f'  {name}: first {probe["first_ms"]} ms, '
+                    f'next {probe["next_ms"]} ms'
+                )
+
+        dump = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output'] == '-':
+            self.stdout.write(dump)
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(dump)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+    @staticmethod
+    def probes():
+        """`name=url` of probed pages, ids are taken from the database."""
+        recipe = Recipe.objects.only('pk').first()
+        if recipe is None:
+            raise CommandError('Needs at least one recipe, run filldb')
+        ingredients = list(
+            RecipeIngredient.objects.filter(recipe=recipe)
+            .values_list('ingredient_id', flat=True)
+        )
+        pantry = urlencode({'ingredients': ingredients}, doseq=True)
+        autocomplete = urlencode({'query': 'сол'})
+        return [
+            'index=/',
+            f'recipe=/recipes/{recipe.pk}/',
+            f'search=/search/?{urlencode({"q": "суп"})}',
+            f'api_ingredients=/api/ingredients/?{autocomplete}',
+            f'api_pantry=/api/pantry/?{pantry}',
+            f'api_state=/api/state/?recipes={recipe.pk}',
+        ]
+
+    def run_child(self, probes, warm, top):
+        command = [sys.executable, '-X', 'importtime',
+                   os.path.join(settings.BASE_DIR, 'manage.py'),
+                   'profile_startup', '--child']
+        if warm:
+            command.append('--warm-up')
+        for probe in probes:
+            command += ['--probe', probe]
+        started = time.time()
+        process = subprocess.run(
+            command, cwd=settings.BASE_DIR, env=os.environ.copy(),
+            capture_output=True, text=True,
+        )
+        if process.returncode:
+            raise CommandError('Profiled process failed:\n' + process.stderr)
+        result = json.loads(process.stdout.splitlines()[-1])
+        result['ready_ms'] = round(1000 * (result.pop('ready') - started), 1)
+        phases = parse_imports(process.stderr.splitlines())
+        result['imports'] = {
+            phase: summarize(imports, top)
+            for phase, imports in phases.items()
+            if phase == STARTUP or phase == 'warm_up'
+        }
+        for name, probe in result['requests'].items():
+            probe['imports'] = summarize(phases.get(name, []), top)
+        return result
+
+    def child(self, options):
+        """Runs in the profiled process, prints one JSON line."""
+        result = {'ready': time.time(), 'warm_up': {}, 'requests': {}}
+        self.mark(PROFILER)
+        from django.test import Client
+        if options['warm_up']:
+            self.mark('warm_up')
+            from recipes.warmup import warm_up
+            result['warm_up'] = warm_up()
+        client = Client()
+        for probe in options['probe']:
+            name, url = probe.split('=', 1)
+            self.mark(name)
+            timings = []
+            for _ in range(2):
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append(round(1000 * (time.perf_counter() - started),
+                                     1))
+            result['requests'][name] = {
+                'url': url,
+                'status': response.status_code,
+                'first_ms': timings[0],
+                'next_ms': timings[1],
+            }
+        self.mark('done')
+        self.stdout.write(json.dumps(result, ensure_ascii=False))
+
+    @staticmethod
+    def mark(phase):
+        sys.stderr.write(f'{MARKER} {phase}\n')
+        sys.stderr.flush()
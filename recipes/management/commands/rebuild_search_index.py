@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recipes.models import Recipe
+from recipes.search import update_search_vector
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """Recompute stored search vectors of all recipes.
+
+    Needed after rows were written without signals, e.g. by
+    `filldb --bulk`. Recipes are updated in pk ranges so that no
+    statement locks the whole table for long.
+    """
+    help = 'rebuild full-text search vectors of recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='recipes per UPDATE statement')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                f'{connection.vendor} searches without stored vectors, '
+                f'nothing to rebuild'
+            ))
+            return
+        ids = list(Recipe.objects.order_by('pk').values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            updated += update_search_vector(ids[start:start + batch_size])
+        self.stdout.write(f'updated: {updated}')
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F
+
+from recipes.models import Recipe
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """Recompute denormalized `Recipe.favourite_count`.
+
+    Counters are kept by the favourites API; rows changed elsewhere (the
+    admin, raw SQL) make them drift until this command runs.
+    """
+    help = 'recompute favourite counters of recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help='recipes per UPDATE statement')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only report drifted counters')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last = Recipe.objects.order_by('-pk').values_list('pk', flat=True)
+        last = last.first() or 0
+        checked = drifted = 0
+        for start in range(0, last, batch_size):
+            batch = Recipe.objects.filter(pk__gt=start,
+                                          pk__lte=start + batch_size)
+            drifted += (batch
+                        .annotate(actual=Count('favourite_by'))
+                        .exclude(favourite_count=F('actual'))
+                        .count())
+            if options['dry_run']:
+                checked += batch.count()
+            else:
+                checked += batch.sync_favourite_count()
+
+        self.stdout.write(f'checked: {checked}, drifted: {drifted}')
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Favourite counters fixed'))
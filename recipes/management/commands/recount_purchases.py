@@ -0,0 +1,62 @@
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from recipes.cart import PURCHASES_COUNT_KEY
+from recipes.models import User
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """Recompute cached cart sizes shown in the nav badge.
+
+    Counters live in the cache shared by the web processes, only those
+    found there are compared and replaced. Missing ones are counted on
+    next read.
+    """
+    help = 'recompute cached purchase counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only report drifted counters')
+
+    def handle(self, *args, **options):
+        if isinstance(caches['default'], LocMemCache):
+            raise CommandError(
+                'Counters are kept in a process-local cache, this command '
+                'cannot see them. Configure a shared CACHES backend.'
+            )
+        users = (
+            User.objects
+            .annotate(purchases=Count('cart__in_cart'))
+            .order_by('pk')
+            .values_list('pk', 'purchases')
+        )
+        checked = drifted = 0
+        batch = {}
+        for user_id, purchases in users.iterator(chunk_size=BATCH_SIZE):
+            batch[PURCHASES_COUNT_KEY.format(user_id)] = purchases
+            if len(batch) >= BATCH_SIZE:
+                drifted += self.repair(batch, options['dry_run'])
+                checked += len(batch)
+                batch = {}
+        drifted += self.repair(batch, options['dry_run'])
+        checked += len(batch)
+
+        self.stdout.write(f'checked: {checked}, drifted: {drifted}')
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Purchase counters fixed'))
+
+    @staticmethod
+    def repair(counters, dry_run):
+        """Fix cached counters, return how many of them differed."""
+        cached = cache.get_many(counters.keys())
+        drifted = {
+            key: counters[key] for key, value in cached.items()
+            if value != counters[key]
+        }
+        if drifted and not dry_run:
+            cache.set_many(drifted, None)
+        return len(drifted)
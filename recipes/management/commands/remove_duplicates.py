@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from recipes.duplicates import remove_duplicates
+
+
+class Command(BaseCommand):
+    """Delete duplicate relation rows before unique constraints apply.
+
+    Of every group of rows with the same key the oldest one is kept.
+    `migrate` runs the same cleanup before migrations of `recipes`, the
+    command reports duplicates (`--dry-run`) or removes them by hand.
+    """
+    help = 'delete duplicate ingredient, tag, follow and cart rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only count duplicates')
+
+    def handle(self, *args, **options):
+        counts = remove_duplicates(options['database'], options['dry_run'])
+        for model, count in counts.items():
+            self.stdout.write(f'{model.__name__}: {count} duplicates')
+        total = sum(counts.values())
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f'Dry run, {total} duplicates left'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'{total} duplicates deleted'
+            ))
@@ -0,0 +1,83 @@
+import asyncio
+
+from django.conf import settings
+
+from recipes import routers
+from recipes.cart import CartSnapshot
+
+PRIMARY_COOKIE = 'use_primary'
+
+
+class Middleware:
+    """Base of middleware that runs natively under WSGI and ASGI.
+
+    Subclasses implement `call` and the coroutine `acall`; Django picks
+    the mode of the rest of the chain, so async views under ASGI are
+    not pushed through `async_to_sync` by these middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # lets Django await the instance, as in `MiddlewareMixin`
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.acall(request)
+        return self.call(request)
+
+
+class ReplicaMiddleware(Middleware):
+    """Read from a replica unless the client has just written.
+
+    Any unsafe request (POST, PUT, PATCH, DELETE) reads from the
+    primary and pins its client there for `PRIMARY_STICKY_SECONDS` with
+    a cookie, so users see their own changes before replicas catch up.
+    """
+
+    def call(self, request):
+        token = self.pick_database(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.reset(token)
+        return self.stick(request, response)
+
+    async def acall(self, request):
+        token = self.pick_database(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.reset(token)
+        return self.stick(request, response)
+
+    @staticmethod
+    def pick_database(request):
+        if (request.method in routers.SAFE_METHODS
+                and PRIMARY_COOKIE not in request.COOKIES):
+            return routers.read_from_replica()
+        return None
+
+    @staticmethod
+    def stick(request, response):
+        if request.method not in routers.SAFE_METHODS:
+            response.set_cookie(PRIMARY_COOKIE, '1',
+                                max_age=settings.PRIMARY_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+class CartMiddleware(Middleware):
+    """Attach a lazily loaded `CartSnapshot` to the request."""
+
+    def call(self, request):
+        request.cart = CartSnapshot(request.user)
+        return self.get_response(request)
+
+    async def acall(self, request):
+        request.cart = CartSnapshot(request.user)
+        return await self.get_response(request)
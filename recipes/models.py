@@ -1,15 +1,23 @@
 from typing import Optional
 
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import Exists, OuterRef
+from django.db import DEFAULT_DB_ALIAS, models
+from django.db.models import (Count, Exists, F, OuterRef, Prefetch, Subquery,
+                              Sum, Window)
+from django.db.models.functions import Coalesce, Greatest, RowNumber
+from django.utils import timezone
 
 User = get_user_model()
 
 min_validator = MinValueValidator(1, 'Значение должно быть больше 0')
 
+TAG_IDS_CACHE_KEY = 'tag_ids_by_slug'
+
 
 class Tag(models.Model):
     name = models.CharField(max_length=20, verbose_name='тэг')
@@ -23,12 +31,26 @@ class Tag(models.Model):
     def __str__(self):
         return self.slug
 
+    @staticmethod
+    def ids_by_slug():
+        """Cached `{slug: id}` of all tags, reset on Tag changes."""
+        tag_ids = cache.get(TAG_IDS_CACHE_KEY)
+        if tag_ids is None:
+            tag_ids = dict(Tag.objects.using(DEFAULT_DB_ALIAS)
+                           .values_list('slug', 'pk'))
+            cache.set(TAG_IDS_CACHE_KEY, tag_ids, None)
+        return tag_ids
+
 
 class Ingredient(models.Model):
     name = models.CharField(max_length=60, verbose_name='ингридиент')
     unit = models.CharField(max_length=20, verbose_name='ед.')
 
     class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='ingredient_name_idx',
+                         opclasses=['varchar_pattern_ops']),
+        ]
         verbose_name = 'Ингридиент'
         verbose_name_plural = 'Ингридиенты'
 
@@ -46,6 +68,138 @@ class RecipeQuerySet(models.QuerySet):
             ),
         ))
 
+    def with_is_in_cart(self, user_id: Optional[int]):
+        """Annotate with in cart flag."""
+        return self.annotate(is_in_cart=Exists(
+            CartRecipe.objects.filter(
+                cart__owner_id=user_id,
+                recipe_id=OuterRef('pk'),
+            ),
+        ))
+
+    def for_cards(self):
+        """Load only what recipe cards show, in a fixed number of queries.
+
+        Recipes with authors come in one query, tags in one more.
+        """
+        return (
+            self
+            .select_related('author')
+            .only('pk', 'name', 'image', 'thumbnails', 'cook_time',
+                  'pub_date', 'favourite_count', 'author__id',
+                  'author__username', 'author__first_name',
+                  'author__last_name')
+            .prefetch_related(Prefetch(
+                'tags', queryset=Tag.objects.only('pk', 'name', 'color'),
+            ))
+        )
+
+    def for_detail(self):
+        """Load recipe page: recipe with author, tags and ingredients."""
+        return (
+            self
+            .select_related('author')
+            .defer('search_vector')
+            .prefetch_related(
+                Prefetch('tags',
+                         queryset=Tag.objects.only('pk', 'name', 'color')),
+                Prefetch('recipe',
+                         queryset=RecipeIngredient.objects
+                         .select_related('ingredient')),
+            )
+        )
+
+    def latest_per_author(self, author_ids, limit: int):
+        """Latest `limit` recipes of every author in one window query.
+
+        Each recipe gets `author_total` with the author's recipe count.
+        Django can't filter on window functions, so the ranked query is
+        wrapped into a raw SELECT.
+        """
+        if not author_ids:
+            return self.none()
+        ranked = (
+            self
+            .filter(author_id__in=author_ids)
+            .only('pk', 'name', 'image', 'thumbnails', 'cook_time',
+                  'pub_date', 'author')
+            .annotate(
+                position=Window(
+                    RowNumber(),
+                    partition_by=[F('author_id')],
+                    order_by=[F('pub_date').desc(), F('pk').desc()],
+                ),
+                author_total=Window(
+                    Count('pk'),
+                    partition_by=[F('author_id')],
+                ),
+            )
+            .order_by()
+        )
+        sql, params = ranked.query.sql_with_params()
+        return self.model.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE position <= %s '
+            f'ORDER BY author_id, position',
+            (*params, limit),
+        )
+
+    def with_tags(self, slugs):
+        """Filter recipes having any of tags with an EXISTS subquery.
+
+        Filtering is skipped if no tags or all tags are selected.
+        """
+        tag_ids = Tag.ids_by_slug()
+        selected = {tag_ids[slug] for slug in slugs if slug in tag_ids}
+        if not slugs or selected == set(tag_ids.values()):
+            return self
+        if not selected:
+            return self.none()
+        return self.filter(Exists(
+            RecipeTag.objects.filter(
+                recipe_id=OuterRef('pk'),
+                tag_id__in=selected,
+            ),
+        ))
+
+    def change_favourite_count(self, delta: int):
+        """Add `delta` to counters in one UPDATE, never going below 0."""
+        return self.update(
+            favourite_count=Greatest(F('favourite_count') + delta, 0)
+        )
+
+    def sync_favourite_count(self):
+        """Recount favourites of recipes in one UPDATE."""
+        return self.update(favourite_count=Coalesce(
+            Subquery(
+                Favourite.objects
+                .filter(recipe_id=OuterRef('pk'))
+                .values('recipe_id')
+                .annotate(total=Count('pk'))
+                .values('total')
+            ),
+            0,
+        ))
+
+    def neighbours_of(self, recipe_id: int):
+        """Recipes favourited together with the recipe, closest first.
+
+        One range scan of `recipe_neighbour_score_idx`.
+        """
+        return (self
+                .filter(neighbour_of__recipe_id=recipe_id)
+                .order_by('-neighbour_of__score'))
+
+    def recommended_for(self, user_id: int):
+        """Neighbours of user's favourites they haven't favourited yet.
+
+        Each recipe gets `score`, the sum of its similarities to the
+        user's favourites.
+        """
+        return (self
+                .filter(neighbour_of__recipe__favourite_by__user_id=user_id)
+                .exclude(favourite_by__user_id=user_id)
+                .annotate(score=Sum('neighbour_of__score')))
+
 
 class Recipe(models.Model):
     name = models.CharField(max_length=60, verbose_name='рецепт')
@@ -70,11 +224,32 @@ class Recipe(models.Model):
                                          related_name='ingredients',
                                          through='RecipeIngredient',
                                          verbose_name='ингридиенты')
+    search_vector = SearchVectorField(null=True, editable=False,
+                                      verbose_name='поисковый вектор')
+    favourite_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='в избранном',
+    )
+    thumbnails = models.CharField(
+        max_length=100, blank=True, editable=False,
+        verbose_name='картинка с уменьшенными копиями',
+    )
 
     objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ["-pub_date", ]
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=['-favourite_count', '-pub_date', '-id'],
+                         name='recipe_popular_idx'),
+            models.Index(fields=['author', '-favourite_count', '-pub_date',
+                                 '-id'],
+                         name='recipe_author_popular_idx'),
+            GinIndex(fields=['search_vector'], name='recipe_search_idx'),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -94,6 +269,14 @@ class RecipeIngredient(models.Model):
     amount = models.PositiveIntegerField(validators=[min_validator, ],
                                          verbose_name='количество')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient'
+            )
+        ]
+
 
 class RecipeTag(models.Model):
     tag = models.ForeignKey(Tag,
@@ -105,6 +288,14 @@ class RecipeTag(models.Model):
                                related_name='tagged_recipe',
                                verbose_name='рецепт')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'tag'),
+                name='unique_recipe_tag'
+            )
+        ]
+
 
 class Follow(models.Model):
 
@@ -118,6 +309,12 @@ class Follow(models.Model):
                                verbose_name='подписан на')
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_follow_user_author'
+            )
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
@@ -148,6 +345,73 @@ class Favourite(models.Model):
         ]
 
 
+class RecipeNeighbour(models.Model):
+    """Recipe favourited by the same users, see `compute_recommendations`."""
+    recipe = models.ForeignKey(Recipe,
+                               on_delete=models.CASCADE,
+                               related_name='neighbours',
+                               verbose_name='рецепт')
+    neighbour = models.ForeignKey(Recipe,
+                                  on_delete=models.CASCADE,
+                                  related_name='neighbour_of',
+                                  verbose_name='похожий рецепт')
+    score = models.FloatField(verbose_name='сходство')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'neighbour'),
+                name='unique_recipe_neighbour'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['recipe', '-score'],
+                         name='recipe_neighbour_score_idx'),
+        ]
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+
+
+class ImageJob(models.Model):
+    """Queued processing of a recipe image, see `recipes.image_jobs`."""
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'в очереди'),
+        (DONE, 'готово'),
+        (FAILED, 'ошибка'),
+    )
+
+    recipe = models.ForeignKey(Recipe,
+                               on_delete=models.CASCADE,
+                               related_name='image_jobs',
+                               verbose_name='рецепт')
+    image = models.CharField(max_length=100, verbose_name='картинка')
+    status = models.CharField(max_length=7, choices=STATUSES,
+                              default=PENDING, verbose_name='статус')
+    attempts = models.PositiveSmallIntegerField(default=0,
+                                                verbose_name='попытки')
+    run_after = models.DateTimeField(default=timezone.now,
+                                     verbose_name='выполнить после')
+    created = models.DateTimeField(auto_now_add=True,
+                                   verbose_name='создано')
+    finished = models.DateTimeField(null=True, blank=True,
+                                    verbose_name='завершено')
+    error = models.TextField(blank=True, verbose_name='ошибка')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'],
+                         name='image_job_queue_idx'),
+        ]
+        verbose_name = 'Обработка картинки'
+        verbose_name_plural = 'Обработка картинок'
+
+    def __str__(self):
+        return f'{self.image} ({self.status})'
+
+
 class Cart(models.Model):
     owner = models.OneToOneField(User,
                                  on_delete=models.CASCADE,
@@ -171,3 +435,11 @@ class CartRecipe(models.Model):
                                on_delete=models.CASCADE,
                                related_name='carts',
                                verbose_name='покупка')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('cart', 'recipe'),
+                name='unique_cart_recipe'
+            )
+        ]
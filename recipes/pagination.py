@@ -0,0 +1,129 @@
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+DATE_ORDERING = ('pub_date', 'pk')
+
+
+class Cursor(str):
+    """Opaque page token, told apart from page numbers in templates."""
+
+
+def encode_cursor(values, reverse: bool) -> Cursor:
+    """Token for rows after (or before, if `reverse`) `values`."""
+    values = [value.isoformat() if isinstance(value, datetime) else value
+              for value in values]
+    data = json.dumps([values, int(reverse)])
+    return Cursor(base64.urlsafe_b64encode(data.encode()).decode())
+
+
+def decode_cursor(token: str):
+    try:
+        values, reverse = json.loads(base64.urlsafe_b64decode(token))
+        return list(values), bool(reverse)
+    except (TypeError, ValueError):
+        raise Http404('Неверная страница')
+
+
+class CursorPage:
+    """Page of a keyset paginated list.
+
+    Mimics the parts of `django.core.paginator.Page` used by templates.
+    """
+
+    def __init__(self, object_list, previous_cursor=None, next_cursor=None):
+        self.object_list = object_list
+        self.previous_cursor = previous_cursor
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset pagination over querysets ordered by `ordering` descending.
+
+    `ordering` must end with a unique field. Each page is one indexed
+    range scan for `per_page + 1` rows, no OFFSET and no COUNT, so deep
+    pages cost the same as the first one.
+    """
+
+    def __init__(self, queryset, per_page, ordering=DATE_ORDERING):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+
+    def _values(self, token):
+        values, reverse = decode_cursor(token)
+        if len(values) != len(self.ordering):
+            raise Http404('Неверная страница')
+        meta = self.queryset.model._meta
+        parsed = []
+        try:
+            for name, value in zip(self.ordering, values):
+                field = meta.pk if name == 'pk' else meta.get_field(name)
+                value = field.to_python(value)
+                if value is None:
+                    raise ValueError('empty cursor value')
+                # range validators keep out-of-range ids away from the DB
+                field.run_validators(value)
+                parsed.append(value)
+        except (ValidationError, TypeError, ValueError):
+            raise Http404('Неверная страница')
+        return parsed, reverse
+
+    def _beyond(self, values, reverse):
+        """Q for rows after `values` in scan direction."""
+        lookup = 'gt' if reverse else 'lt'
+        query = Q()
+        for i, name in enumerate(self.ordering):
+            equal = dict(zip(self.ordering[:i], values[:i]))
+            query |= Q(**equal, **{f'{name}__{lookup}': values[i]})
+        return query
+
+    def _cursor(self, obj, reverse):
+        return encode_cursor(
+            [getattr(obj, name) for name in self.ordering], reverse
+        )
+
+    def page(self, token=None):
+        qs = self.queryset
+        values, reverse = self._values(token) if token else (None, False)
+        if token:
+            qs = qs.filter(self._beyond(values, reverse))
+        prefix = '' if reverse else '-'
+        qs = qs.order_by(*(prefix + name for name in self.ordering))
+
+        object_list = list(qs[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if reverse:
+            object_list.reverse()
+        if not object_list:
+            return CursorPage(object_list)
+
+        first, last = object_list[0], object_list[-1]
+        has_previous = has_more if reverse else token is not None
+        has_next = True if reverse else has_more
+        return CursorPage(
+            object_list,
+            previous_cursor=(self._cursor(first, True)
+                             if has_previous else None),
+            next_cursor=self._cursor(last, False) if has_next else None,
+        )
@@ -0,0 +1,106 @@
+"""Item-item collaborative filtering over the favourites matrix.
+
+Favourites form a sparse binary user × recipe matrix. Two recipes are
+similar when the same users favourite them, scored with cosine
+similarity of their columns: common users / sqrt(users_a * users_b).
+Co-occurrence counts are computed block by block as sparse matrix
+products, and top-K neighbours of every recipe in a block are selected
+with one sort, so memory is bounded by the block size and no Python
+loop runs per recipe or per favourite.
+
+Only the batch job (`manage.py compute_recommendations`) imports this
+module; pages read the stored `RecipeNeighbour` rows.
+"""
+from itertools import chain
+from typing import NamedTuple
+
+import numpy as np
+from scipy import sparse
+
+from recipes.dataset import insert_rows
+from recipes.models import Favourite, RecipeNeighbour
+
+NEIGHBOURS = 20
+MIN_SUPPORT = 2
+BLOCK_SIZE = 2000
+WRITE_BATCH_SIZE = 10000
+
+
+class Neighbours(NamedTuple):
+    recipe_ids: np.ndarray
+    neighbour_ids: np.ndarray
+    scores: np.ndarray
+
+
+def load_favourites():
+    """Return `(user_ids, recipe_ids)` arrays of all favourites."""
+    rows = Favourite.objects.values_list('user_id', 'recipe_id')
+    # one query: a count read beforehand goes stale when favourites are
+    # added or removed before the rows are fetched
+    pairs = np.fromiter(
+        chain.from_iterable(rows.iterator(chunk_size=WRITE_BATCH_SIZE)),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def _top_k(rows, cols, scores, k):
+    """Keep `k` best scores of every row, rows sorted ascending."""
+    order = np.lexsort((-scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    positions = np.arange(len(rows))
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = rows[1:] != rows[:-1]
+    group_start = np.maximum.accumulate(np.where(first, positions, 0))
+    keep = positions - group_start < k
+    return rows[keep], cols[keep], scores[keep]
+
+
+def item_neighbours(user_ids, recipe_ids, k=NEIGHBOURS,
+                    min_support=MIN_SUPPORT,
+                    block_size=BLOCK_SIZE) -> Neighbours:
+    """Top `k` most similar recipes for every favourited recipe.
+
+    Pairs favourited together by fewer than `min_support` users are
+    ignored, as a single shared user says little about similarity.
+    """
+    if not len(recipe_ids):
+        empty = np.array([], dtype=np.int64)
+        return Neighbours(empty, empty, np.array([], dtype=np.float32))
+    items, item_index = np.unique(recipe_ids, return_inverse=True)
+    _, user_index = np.unique(user_ids, return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(item_index), dtype=np.float32),
+         (user_index, item_index)),
+        shape=(user_index.max() + 1, len(items)),
+    )
+    matrix.data[:] = 1
+    by_item = matrix.T.tocsr()
+    norms = np.sqrt(np.asarray(matrix.sum(axis=0)).ravel())
+
+    found_rows, found_cols, found_scores = [], [], []
+    for start in range(0, len(items), block_size):
+        block = (by_item[start:start + block_size] @ matrix).tocoo()
+        rows = block.row.astype(np.int64) + start
+        cols = block.col.astype(np.int64)
+        keep = (rows != cols) & (block.data >= min_support)
+        rows, cols = rows[keep], cols[keep]
+        scores = block.data[keep] / (norms[rows] * norms[cols])
+        rows, cols, scores = _top_k(rows, cols, scores, k)
+        found_rows.append(rows)
+        found_cols.append(cols)
+        found_scores.append(scores)
+
+    rows = np.concatenate(found_rows)
+    return Neighbours(items[rows], items[np.concatenate(found_cols)],
+                      np.concatenate(found_scores))
+
+
+def store_neighbours(neighbours: Neighbours) -> int:
+    """Replace all `RecipeNeighbour` rows, call inside a transaction."""
+    RecipeNeighbour.objects.all().delete()
+    rows = zip(neighbours.recipe_ids.tolist(),
+               neighbours.neighbour_ids.tolist(),
+               np.round(neighbours.scores, 6).tolist())
+    return insert_rows(RecipeNeighbour, ('recipe', 'neighbour', 'score'),
+                       rows, WRITE_BATCH_SIZE)
@@ -0,0 +1,67 @@
+"""Read replica routing with read-your-writes stickiness.
+
+Writes always go to the primary (`default`). Reads go to the primary
+too, except inside requests that `ReplicaMiddleware` lets read from a
+replica: safe (GET, HEAD, OPTIONS) requests of clients that have not
+changed anything for `PRIMARY_STICKY_SECONDS`. One replica is picked
+per request, so a page never mixes replicas with different lag.
+Management commands and workers always read from the primary, and so
+do sessions and a database cache backend: a session missing on a
+lagging replica would log its user out, an old cache entry would bring
+back an invalidated version.
+
+Caches filled from the database and invalidated by version tokens
+(pantry and ingredient indexes, tag ids, cart sizes) are loaded from
+the primary explicitly, so a lagging replica can't store stale data
+under a fresh version. Recipe cards are rendered from replica reads,
+`recipes.card_cache` skips caching those whose token is younger than
+the sticky window.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_read_alias = ContextVar('read_alias', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# `django_cache` is the app label of DatabaseCache entries
+PRIMARY_APPS = ('sessions', 'django_cache')
+
+
+def read_from_replica():
+    """Send reads of the current context to a random replica.
+
+    Returns a token for `reset`, or None if there are no replicas.
+    """
+    replicas = settings.REPLICA_DATABASES
+    if not replicas:
+        return None
+    return _read_alias.set(random.choice(replicas))
+
+
+def reading_from_replica() -> bool:
+    return _read_alias.get() is not None
+
+
+def reset(token):
+    if token is not None:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        return _read_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Replicas hold the same rows as the primary."""
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
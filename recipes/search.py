@@ -0,0 +1,97 @@
+"""Full-text recipe search over name, description and ingredient names.
+
+On PostgreSQL every recipe stores a weighted `tsvector` in
+`Recipe.search_vector` (GIN indexed, `russian` configuration) and
+queries are ranked with `ts_rank`. Vectors are refreshed by signals
+and by views saving ingredients in bulk, and rebuilt with
+`manage.py rebuild_search_index` after raw imports.
+
+Other backends use a LIKE fallback meant for tests and local runs: every
+word must occur somewhere, and the rank sums field weights of matches.
+SQLite compares non-ASCII letters case-sensitively.
+"""
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections
+from django.db.models import (Case, Exists, F, FloatField, OuterRef, Q,
+                              Subquery, Value, When)
+
+from recipes.models import Recipe, RecipeIngredient
+
+SEARCH_CONFIG = 'russian'
+MAX_WORDS = 10
+NAME_WEIGHT, DESCRIPTION_WEIGHT, INGREDIENTS_WEIGHT = 1.0, 0.4, 0.2
+
+
+def _is_postgres(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def search_vector():
+    """Expression computing a recipe vector inside an UPDATE."""
+    ingredient_names = Subquery(
+        RecipeIngredient.objects
+        .filter(recipe_id=OuterRef('pk'))
+        .values('recipe_id')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(ingredient_names, weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vector(recipe_ids=None) -> int:
+    """Recompute vectors of `recipe_ids` (ids or a subquery), or all.
+
+    One UPDATE statement; does nothing on backends other than
+    PostgreSQL.
+    """
+    qs = Recipe.objects.all()
+    if not _is_postgres(qs):
+        return 0
+    if recipe_ids is not None:
+        qs = qs.filter(pk__in=recipe_ids)
+    return qs.update(search_vector=search_vector())
+
+
+def _fallback_search(queryset, words):
+    rank = Value(0.0, output_field=FloatField())
+    for word in words:
+        in_name = Q(name__icontains=word)
+        in_description = Q(description__icontains=word)
+        in_ingredients = Exists(RecipeIngredient.objects.filter(
+            recipe_id=OuterRef('pk'), ingredient__name__icontains=word,
+        ))
+        queryset = queryset.filter(
+            in_name | in_description | in_ingredients
+        )
+        for condition, weight in ((in_name, NAME_WEIGHT),
+                                  (in_description, DESCRIPTION_WEIGHT),
+                                  (in_ingredients, INGREDIENTS_WEIGHT)):
+            rank = rank + Case(When(condition, then=Value(weight)),
+                               default=Value(0.0),
+                               output_field=FloatField())
+    return queryset.annotate(rank=rank)
+
+
+def search_recipes(queryset, text: str):
+    """Recipes of `queryset` matching `text`, most relevant first.
+
+    Each recipe gets a `rank` annotation. Blank text matches nothing.
+    """
+    words = text.split()[:MAX_WORDS]
+    if not words:
+        return queryset.none()
+    if _is_postgres(queryset):
+        query = SearchQuery(' '.join(words), config=SEARCH_CONFIG,
+                            search_type='websearch')
+        queryset = (queryset
+                    .filter(search_vector=query)
+                    .annotate(rank=SearchRank(F('search_vector'), query)))
+    else:
+        queryset = _fallback_search(queryset, words)
+    return queryset.order_by('-rank', '-pub_date', '-pk')
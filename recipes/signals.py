@@ -0,0 +1,112 @@
+import logging
+
+from django.core.cache import cache
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_migrate)
+from django.dispatch import receiver
+
+from recipes import card_cache, changes, image_jobs, pantry
+from recipes.cart import reset_purchases_count
+from recipes.duplicates import remove_duplicates
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (TAG_IDS_CACHE_KEY, CartRecipe, Ingredient, Recipe,
+                            RecipeIngredient, RecipeTag, Tag, User)
+from recipes.search import update_search_vector
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELDS = {'name', 'description'}
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def reset_tag_ids(sender, **kwargs):
+    cache.delete(TAG_IDS_CACHE_KEY)
+    card_cache.bump_tags()
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(sender, instance, created, **kwargs):
+    if not created:
+        update_search_vector(
+            RecipeIngredient.objects
+            .filter(ingredient=instance)
+            .values('recipe_id')
+        )
+
+
+@receiver(changes.recipes_changed)
+def refresh_changed_recipes(sender, recipe_ids, **kwargs):
+    update_search_vector(recipe_ids)
+    pantry.mark_changed(recipe_ids)
+    for recipe_id in recipe_ids:
+        card_cache.bump_recipe(recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_changed(sender, instance, update_fields, **kwargs):
+    if not update_fields or SEARCH_FIELDS & set(update_fields):
+        changes.touch([instance.pk])
+    else:
+        card_cache.bump_recipe(instance.pk)
+    if not update_fields or 'image' in update_fields:
+        image_jobs.enqueue(instance)
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+@receiver([post_save, post_delete], sender=RecipeTag)
+def recipe_row_changed(sender, instance, **kwargs):
+    changes.touch([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_set(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        card_cache.bump_tags()
+    else:
+        changes.touch([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, update_fields, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    card_cache.bump_author(instance.pk)
+
+
+@receiver(pre_delete, sender=User)
+def drop_favourites_of_deleted_user(sender, instance, **kwargs):
+    Recipe.objects.filter(
+        favourite_by__user=instance
+    ).change_favourite_count(-1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def reset_carts_of_deleted_recipe(sender, instance, **kwargs):
+    reset_purchases_count(
+        CartRecipe.objects
+        .filter(recipe=instance)
+        .values_list('cart__owner_id', flat=True)
+    )
+
+
+@receiver(pre_migrate)
+def remove_duplicates_before_constraints(sender, app_config, using, plan,
+                                         **kwargs):
+    """Unique constraints of a new migration fail on duplicate rows."""
+    if app_config.name != 'recipes' or not any(
+            migration.app_label == 'recipes' and not backwards
+            for migration, backwards in plan or ()):
+        return
+    counts = remove_duplicates(using)
+    if any(counts.values()):
+        logger.warning('Removed duplicates before migrating: %s', ', '.join(
+            f'{model.__name__} {count}'
+            for model, count in counts.items() if count
+        ))
@@ -1,5 +1,8 @@
 from django import template
 
+from recipes import thumbnails
+from recipes.pagination import Cursor
+
 register = template.Library()
 
 
@@ -11,8 +14,9 @@ def addclass(field, css):
 @register.filter
 def tag_filtered(request, tag_slug):
     q_dict = request.GET.copy()
-    if 'page' in q_dict:
-        q_dict.pop('page')
+    for key in ('page', 'cursor'):
+        if key in q_dict:
+            q_dict.pop(key)
     tags = q_dict.getlist('tags')
     if tag_slug in tags:
         tags.remove(tag_slug)
@@ -23,8 +27,49 @@ def tag_filtered(request, tag_slug):
     return request.path + '?' + q_dict.urlencode()
 
 
+@register.filter
+def ordered(request, order):
+    """URL of current list sorted by `order`, from its first page."""
+    q_dict = request.GET.copy()
+    for key in ('page', 'cursor'):
+        q_dict.pop(key, None)
+    q_dict['order'] = order
+    return request.path + '?' + q_dict.urlencode()
+
+
 @register.filter
 def pagination(request, page):
+    """Query string for page number or keyset `Cursor` token."""
     request_copy = request.GET.copy()
-    request_copy["page"] = page
+    if isinstance(page, Cursor):
+        request_copy.pop('page', None)
+        request_copy['cursor'] = page
+    else:
+        request_copy.pop('cursor', None)
+        request_copy['page'] = page
     return request_copy.urlencode()
+
+
+@register.inclusion_tag('includes/recipe_image.html')
+def recipe_image(recipe, variant, css_class):
+    """Recipe image with WebP and JPEG `srcset` of its `variant`.
+
+    Shows the default placeholder until the image is processed.
+    """
+    image = recipe.image
+    context = {'recipe': recipe, 'css_class': css_class}
+    if recipe.thumbnails != image.name:
+        context['src'] = image.storage.url(image.field.default)
+        return context
+    context.update(
+        sizes=thumbnails.VARIANTS[variant].sizes,
+        webp_srcset=thumbnails.srcset(image, variant,
+                                      thumbnails.WEBP.extension),
+        jpeg_srcset=thumbnails.srcset(image, variant,
+                                      thumbnails.JPEG.extension),
+        src=image.storage.url(thumbnails.variant_name(
+            image.name, variant, thumbnails.widths(variant)[0],
+            thumbnails.JPEG.extension,
+        )),
+    )
+    return context
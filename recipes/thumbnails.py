@@ -0,0 +1,132 @@
+"""Resized variants of recipe images.
+
+Every image gets a few cropped variants for the places it is shown,
+each in WebP and JPEG, at 1x and 2x width. Variant names are derived
+from the source name, so templates build `srcset` without touching
+storage or the database. `Recipe.thumbnails` holds the image name whose
+variants are on disk: a new upload gets a new name and only then are
+variants generated again, by the `recipes.image_jobs` worker.
+"""
+import io
+import posixpath
+from typing import NamedTuple
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+DIRECTORY = 'thumbnails'
+DENSITIES = (1, 2)
+
+
+class Variant(NamedTuple):
+    width: int
+    height: int
+    sizes: str
+
+
+class Format(NamedTuple):
+    extension: str
+    pil_format: str
+    options: dict
+
+
+VARIANTS = {
+    'card': Variant(363, 240, '(max-width: 1200px) 33vw, 363px'),
+    'detail': Variant(480, 480, '480px'),
+    'mini': Variant(90, 90, '90px'),
+}
+WEBP = Format('webp', 'WEBP', {'quality': 80, 'method': 4})
+JPEG = Format('jpg', 'JPEG', {'quality': 82, 'optimize': True,
+                              'progressive': True})
+FORMATS = (WEBP, JPEG)
+METADATA_FORMATS = ('JPEG', 'PNG', 'WEBP')
+ORIENTATION = 0x0112
+
+
+def variant_name(name, variant, width, extension):
+    """Storage name of `variant` of image `name` at `width` pixels."""
+    head, tail = posixpath.split(name)
+    return posixpath.join(head, DIRECTORY,
+                          f'{tail}.{variant}.{width}w.{extension}')
+
+
+def widths(variant):
+    return [VARIANTS[variant].width * density for density in DENSITIES]
+
+
+def srcset(image, variant, extension):
+    """`srcset` attribute value for a `FieldFile` image."""
+    candidates = []
+    for width in widths(variant):
+        name = variant_name(image.name, variant, width, extension)
+        candidates.append(f'{image.storage.url(name)} {width}w')
+    return ', '.join(candidates)
+
+
+def _open(storage, name):
+    with storage.open(name) as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            return background
+        return image.convert('RGB')
+
+
+def strip_metadata(name, storage) -> bool:
+    """Rewrite image `name` without EXIF, applying its orientation.
+
+    JPEGs that need no rotation keep their quantization tables, so they
+    are not recompressed at a lower quality.
+    """
+    with storage.open(name) as file:
+        image = Image.open(file)
+        exif = image.getexif()
+        if not exif or image.format not in METADATA_FORMATS:
+            return False
+        pil_format = image.format
+        options = {}
+        if 'icc_profile' in image.info:
+            options['icc_profile'] = image.info['icc_profile']
+        if exif.get(ORIENTATION, 1) == 1 and pil_format == 'JPEG':
+            options['quality'] = 'keep'
+        else:
+            image = ImageOps.exif_transpose(image)
+            if pil_format == 'JPEG':
+                options['quality'] = 90
+        content = io.BytesIO()
+        image.save(content, pil_format, **options)
+    storage.delete(name)
+    storage.save(name, ContentFile(content.getvalue()))
+    return True
+
+
+def generate(name, storage, force=False):
+    """Write missing variants of image `name`, return how many."""
+    targets = [
+        (variant_name(name, variant, spec.width * density, fmt.extension),
+         spec, density, fmt)
+        for variant, spec in VARIANTS.items()
+        for density in DENSITIES
+        for fmt in FORMATS
+    ]
+    if not force:
+        targets = [target for target in targets
+                   if not storage.exists(target[0])]
+    if not targets:
+        return 0
+
+    source = _open(storage, name)
+    resized = {}
+    for target, spec, density, fmt in targets:
+        size = (spec.width * density, spec.height * density)
+        if size not in resized:
+            resized[size] = ImageOps.fit(source, size, Image.LANCZOS)
+        content = io.BytesIO()
+        resized[size].save(content, fmt.pil_format, **fmt.options)
+        if storage.exists(target):
+            storage.delete(target)
+        storage.save(target, ContentFile(content.getvalue()))
+    return len(targets)
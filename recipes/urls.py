@@ -1,8 +1,10 @@
+from django.conf import settings
 from django.conf.urls import url
 from django.urls import include, path
 from rest_framework.urlpatterns import format_suffix_patterns
 
 from recipes import utils, views
+from recipes.api import async_views as async_api
 from recipes.api import views as api
 
 views_patterns = [
@@ -10,6 +12,10 @@ views_patterns = [
          views.IndexView.as_view(), name='index'),
     path('favourites/',
          views.FavouriteView.as_view(), name='favourites'),
+    path('search/', views.SearchView.as_view(), name='search'),
+    path('pantry/', views.PantryView.as_view(), name='pantry'),
+    path('recommendations/', views.RecommendationsView.as_view(),
+         name='recommendations'),
     path('profiles/<str:username>/',
          views.ProfileView.as_view(), name='profile'),
     path('recipes/create/', views.new_recipe, name='create'),
@@ -24,17 +30,36 @@ views_patterns = [
     path('technologies/', views.TechView.as_view(), name='technologies'),
 ]
 
-api_patterns = [
-    path('ingredients/', api.GetIngredients.as_view()),
-    path('favourites/',
-         api.AddToFavorites.as_view()),
-    path('favourites/<int:pk>/',
-         api.RemoveFromFavorites.as_view()),
-    path('subscriptions/', api.Subscribe.as_view()),
-    path('subscriptions/<int:pk>/', api.UnSubscribe.as_view()),
-    path('purchases/', api.AddPurchase.as_view()),
-    path('purchases/<int:pk>/', api.RemoveFromPurchases.as_view(),
-         name='delete_purchase'),
+if settings.ASYNC_API_VIEWS:
+    item_patterns = [
+        path('ingredients/', async_api.ingredients),
+        path('favourites/', async_api.add_favourite),
+        path('favourites/<int:pk>/', async_api.remove_favourite),
+        path('subscriptions/', async_api.subscribe),
+        path('subscriptions/<int:pk>/', async_api.unsubscribe),
+        path('purchases/', async_api.add_purchase),
+        path('purchases/<int:pk>/', async_api.remove_purchase,
+             name='delete_purchase'),
+    ]
+else:
+    item_patterns = [
+        path('ingredients/', api.GetIngredients.as_view()),
+        path('favourites/', api.AddToFavorites.as_view()),
+        path('favourites/<int:pk>/', api.RemoveFromFavorites.as_view()),
+        path('subscriptions/', api.Subscribe.as_view()),
+        path('subscriptions/<int:pk>/', api.UnSubscribe.as_view()),
+        path('purchases/', api.AddPurchase.as_view()),
+        path('purchases/<int:pk>/', api.RemoveFromPurchases.as_view(),
+             name='delete_purchase'),
+    ]
+
+api_patterns = item_patterns + [
+    path('state/', api.UserState.as_view()),
+    path('search/', api.SearchRecipes.as_view()),
+    path('pantry/', api.PantrySearch.as_view()),
+    path('favourites/batch/', api.FavoritesBatch.as_view()),
+    path('subscriptions/batch/', api.SubscriptionsBatch.as_view()),
+    path('purchases/batch/', api.PurchasesBatch.as_view()),
 ]
 
 urlpatterns = [
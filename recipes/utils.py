@@ -1,44 +1,78 @@
-import os
+import csv
+import json
 
-from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.shortcuts import HttpResponse, get_object_or_404
+from django.db.models import Sum
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 
-from recipes.models import Ingredient, RecipeIngredient
+from recipes.models import RecipeIngredient
+
+
+class Echo:
+    """File-like object that returns written value instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def purchases_totals(user):
+    """Sum ingredient amounts of all recipes in user's cart in one query."""
+    return (
+        RecipeIngredient.objects
+        .filter(recipe__carts__cart__owner=user)
+        .values_list('ingredient__name', 'ingredient__unit')
+        .annotate(total=Sum('amount'))
+        .order_by('ingredient__name', 'ingredient__unit')
+    )
+
+
+def export_txt(rows):
+    for name, unit, total in rows:
+        yield f'{name}, {unit} - {total}\n'
+
+
+def export_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('ingredient', 'unit', 'amount'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_json(rows):
+    yield '['
+    separator = ''
+    for name, unit, total in rows:
+        item = {'ingredient': name, 'unit': unit, 'amount': total}
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+EXPORT_FORMATS = {
+    'txt': ('text/plain', export_txt),
+    'csv': ('text/csv', export_csv),
+    'json': ('application/json', export_json),
+}
 
 
 @login_required
 def download_purchases(request):
-    recipes = request.user.cart.recipes.all()
-    ingredient_qs = RecipeIngredient.objects.filter(
-        recipe__in=recipes
-    )
+    file_format = request.GET.get('format', 'txt')
+    if file_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest(
+            f'Неизвестный формат {file_format}, '
+            f'доступны: {", ".join(EXPORT_FORMATS)}'
+        )
+    content_type, exporter = EXPORT_FORMATS[file_format]
 
-    ingredient_list = {}
-    for r_i in ingredient_qs.values():
-        pk, ingredient_id, recipe_id, amount = r_i.values()
-        ingredient = get_object_or_404(Ingredient, pk=ingredient_id)
-        full_name = ingredient.name + ', ' + ingredient.unit
-        if full_name in ingredient_list:
-            ingredient_list[full_name] += amount
-        else:
-            ingredient_list[full_name] = amount
-
-    file_name = f'{settings.MEDIA_ROOT}/{request.user.username}_cart.txt'
-    file = open(file_name, 'w', encoding='utf-8')
-
-    for name, amount in ingredient_list.items():
-        ingrid_line = f'{name} - {amount}\n'
-        file.write(ingrid_line)
-    file.close()
-    file = open(file_name, 'r', encoding='utf-8')
-    response = HttpResponse(file.read())
-    file.close()
-
-    response['Content-Type'] = 'text/plain'
-    response['Content-Length'] = str(os.stat(file_name).st_size)
-    short_name = f'{request.user.username}_cart.txt'
-    response['Content-Disposition'] = f"attachment; filename={short_name}"
-    os.remove(file_name)
+    # one row per ingredient: load them here, ASGI iterates the streamed
+    # body on the event loop where queries are not allowed
+    rows = list(purchases_totals(request.user))
+    response = StreamingHttpResponse(
+        exporter(rows),
+        content_type=f'{content_type}; charset=utf-8',
+    )
+    short_name = f'{request.user.username}_cart.{file_format}'
+    response['Content-Disposition'] = f'attachment; filename={short_name}'
 
     return response
@@ -1,30 +1,36 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Count
-from django.http.response import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views import generic
 from django.views.generic import DetailView, ListView, TemplateView
 
+from recipes.card_cache import set_card_versions
 from recipes.forms import RecipeForm
-from recipes.models import (Cart, Ingredient, Recipe, RecipeIngredient,
-                            RecipeTag, Tag, User)
+from recipes.ingredient_index import normalize
+from recipes.models import Ingredient, Recipe, User
+from recipes.pagination import DATE_ORDERING, CursorPaginator
+from recipes.pantry import ORDERS, pantry_index
+from recipes.search import search_recipes
+from recipes.writer import RecipeWriter
 
+RECIPE_ORDERINGS = {
+    'new': DATE_ORDERING,
+    'popular': ('favourite_count', 'pub_date', 'pk'),
+}
 
-class IsFavouriteMixin:
-    """Add annotation with favorite mark to the View."""
 
-    def get_queryset(self):
-        """Annotate with favorite mark."""
-        qs = super().get_queryset()
-        qs = (
-            qs
-            .select_related('author')
-            .with_is_favourite(user_id=self.request.user.id)
-        )
+class UserStateMixin:
+    """Mark recipes with current user's favourites and cart."""
 
-        return qs
+    def with_user_state(self, qs):
+        """Annotate marks unless they are hydrated on the client."""
+        if settings.USER_STATE_HYDRATION:
+            return qs
+        user_id = self.request.user.id
+        return (qs
+                .with_is_favourite(user_id=user_id)
+                .with_is_in_cart(user_id=user_id))
 
 
 class CartMixin(generic.base.ContextMixin):
@@ -33,43 +39,47 @@ class CartMixin(generic.base.ContextMixin):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        if self.request.user.is_authenticated:
-            context['cart'] = Cart.objects.get_or_create(
-                owner=self.request.user)[0]
+        context['cart'] = self.request.cart
         return context
 
 
-class BaseRecipeListView(ListView, IsFavouriteMixin, CartMixin):
+class BaseRecipeListView(ListView, UserStateMixin, CartMixin):
     """Base view for Recipe list."""
     context_object_name = 'recipe_list'
     queryset = Recipe.objects.all()
     paginate_by = settings.LIST_OBJECTS
     page_title = None
 
+    def get_order(self):
+        """Key of `RECIPE_ORDERINGS` from `order` parameter."""
+        order = self.request.GET.get('order')
+        return order if order in RECIPE_ORDERINGS else 'new'
+
     def get_queryset(self):
         """Annotate with favorite mark."""
-        qs = super().get_queryset()
-        qs = (
-            qs
-            .prefetch_related('recipe__ingredient')
-            .with_is_favourite(user_id=self.request.user.id)
-        )
-        tags = self.request.GET.getlist('tags')
-
-        if not tags:
-            tags = Tag.objects.values_list('slug')
-            tags = [slug for tag in tags for slug in tag]
-
+        qs = self.with_user_state(super().get_queryset().for_cards())
         qs = (qs
-              .filter(tags__slug__in=tags)
-              .annotate(c=Count('pk'))
-              .order_by('-pub_date'))
+              .with_tags(self.request.GET.getlist('tags'))
+              .order_by(*('-' + name
+                          for name in RECIPE_ORDERINGS[self.get_order()])))
         return qs
 
+    def paginate_queryset(self, queryset, page_size):
+        """Use keyset pagination unless offset mode is configured."""
+        if settings.RECIPE_LIST_PAGINATION != 'cursor':
+            return super().paginate_queryset(queryset, page_size)
+        page = CursorPaginator(
+            queryset, page_size, RECIPE_ORDERINGS[self.get_order()]
+        ).page(self.request.GET.get('cursor'))
+        return None, page, page.object_list, page.has_other_pages()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         tags = self.request.GET.getlist('tags')
         context['tags'] = tags
+        context['order'] = self.get_order()
+        set_card_versions(context['page_obj'] or context['object_list'])
+        context['card_cache_timeout'] = settings.RECIPE_CARD_CACHE_TIMEOUT
         return context
 
 
@@ -78,6 +88,98 @@ class IndexView(BaseRecipeListView):
     template_name = 'recipes/recipe_list.html'
 
 
+class SearchView(BaseRecipeListView):
+    """Recipes matching `q`, most relevant first."""
+    template_name = 'recipes/search.html'
+
+    def get_queryset(self):
+        return search_recipes(super().get_queryset(),
+                              self.request.GET.get('q', ''))
+
+    def paginate_queryset(self, queryset, page_size):
+        """Ranked results can't use keyset pagination by date."""
+        return ListView.paginate_queryset(self, queryset, page_size)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        return context
+
+
+class PantryView(ListView, UserStateMixin, CartMixin):
+    """Recipes ranked by how much of them the user already has.
+
+    `ingredients` is a comma separated list of ingredient names, `order`
+    one of `recipes.pantry.ORDERS`.
+    """
+    template_name = 'recipes/pantry.html'
+    context_object_name = 'matches'
+    paginate_by = settings.LIST_OBJECTS
+
+    @staticmethod
+    def find_ingredients(names):
+        """Return `({name: id}, unknown names)`, ignoring case."""
+        wanted = {normalize(name): name.strip()
+                  for name in names if name.strip()}
+        found = {}
+        for pk, name in (Ingredient.objects
+                         .filter(name__in={*wanted, *wanted.values()})
+                         .values_list('pk', 'name')):
+            found.setdefault(normalize(name), (name, pk))
+        ingredients = dict(found[key] for key in wanted if key in found)
+        unknown = [name for key, name in wanted.items() if key not in found]
+        return ingredients, unknown
+
+    def get_queryset(self):
+        names = self.request.GET.get('ingredients', '').split(',')
+        self.ingredients, self.unknown = self.find_ingredients(
+            names[:settings.PANTRY_MAX_INGREDIENTS]
+        )
+        self.order = self.request.GET.get('order')
+        if self.order not in ORDERS:
+            self.order = ORDERS[0]
+        if not self.ingredients:
+            return []
+        return pantry_index.search(self.ingredients.values(), self.order,
+                                   limit=settings.PANTRY_RESULTS_LIMIT)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        matches = context['object_list']
+        recipes = self.with_user_state(Recipe.objects.for_cards()).in_bulk(
+            [match.recipe_id for match in matches]
+        )
+        recipe_list = []
+        for match in matches:
+            recipe = recipes.get(match.recipe_id)
+            if recipe is not None:
+                recipe.pantry = match
+                recipe_list.append(recipe)
+        set_card_versions(recipe_list)
+        context.update({
+            'recipe_list': recipe_list,
+            'ingredients': list(self.ingredients),
+            'unknown': self.unknown,
+            'order': self.order,
+            'card_cache_timeout': settings.RECIPE_CARD_CACHE_TIMEOUT,
+        })
+        return context
+
+
+class RecommendationsView(LoginRequiredMixin, BaseRecipeListView):
+    """Recipes similar to current user's favourites, best first."""
+    template_name = 'recipes/recommendations.html'
+
+    def get_queryset(self):
+        return (super().get_queryset()
+                .recommended_for(self.request.user.id)
+                .order_by('-score', '-pk'))
+
+    def paginate_queryset(self, queryset, page_size):
+        """Ranked results can't use keyset pagination by date."""
+        return ListView.paginate_queryset(self, queryset, page_size)
+
+
 class FavouriteView(LoginRequiredMixin, BaseRecipeListView):
     """List of current user's favorite Recipes."""
     template_name = 'recipes/recipe_list.html'
@@ -113,8 +215,8 @@ class ProfileView(BaseRecipeListView, CartMixin):
     def get_context_data(self, **kwargs):
         owner = self.user
         viewer = self.request.user
-        if viewer.is_authenticated:
-            following = viewer.follower.filter(author=owner)
+        if viewer.is_authenticated and not settings.USER_STATE_HYDRATION:
+            following = viewer.follower.filter(author=owner).exists()
         else:
             following = False
 
@@ -125,30 +227,35 @@ class ProfileView(BaseRecipeListView, CartMixin):
         return context
 
 
-class RecipeDetailView(DetailView, IsFavouriteMixin, CartMixin):
+class RecipeDetailView(DetailView, UserStateMixin, CartMixin):
     """Page with Recipe details."""
     queryset = Recipe.objects.all()
     template_name = 'recipes/recipe_detail.html'
 
     def get_queryset(self):
         """Annotate with favorite mark."""
-        qs = super().get_queryset()
-        qs = (
-            qs
-            .prefetch_related('recipe__ingredient')
-            .with_is_favourite(user_id=self.request.user.id)
-        )
+        return self.with_user_state(super().get_queryset().for_detail())
 
-        return qs
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['neighbours'] = (
+            Recipe.objects
+            .neighbours_of(self.object.pk)
+            .only('pk', 'name', 'image')[:settings.RECIPE_NEIGHBOURS_SHOWN]
+        )
+        return context
 
 
-class MyFollowingsView(ListView, CartMixin, LoginRequiredMixin):
+class MyFollowingsView(LoginRequiredMixin, ListView, CartMixin):
     context_object_name = 'users'
     paginate_by = 3
     template_name = 'recipes/my_subscriptions.html'
+    recipes_per_author = 3
 
     def get_queryset(self):
-        qs = User.objects.filter(following__user=self.request.user)
+        qs = (User.objects
+              .filter(following__user=self.request.user)
+              .order_by('username'))
         return qs
 
     def get_context_data(self, **kwargs):
@@ -157,18 +264,26 @@ class MyFollowingsView(ListView, CartMixin, LoginRequiredMixin):
         context['user'] = self.request.user
         context['following'] = following
 
+        owners = {owner.pk: owner for owner in context['object_list']}
+        for owner in owners.values():
+            owner.latest_recipes = []
+            owner.more_recipes = 0
+        for recipe in Recipe.objects.latest_per_author(
+                list(owners), self.recipes_per_author):
+            owner = owners[recipe.author_id]
+            owner.latest_recipes.append(recipe)
+            owner.more_recipes = recipe.author_total - recipe.position
+
         return context
 
 
-class MyCartView(ListView, CartMixin, LoginRequiredMixin):
+class MyCartView(LoginRequiredMixin, ListView, CartMixin):
     context_object_name = 'recipes'
     paginate_by = settings.LIST_OBJECTS
     template_name = 'recipes/purchase_list.html'
 
     def get_queryset(self):
-        cart = Cart.objects.get_or_create(owner=self.request.user)[0]
-        recipes = cart.recipes.all()
-        return recipes
+        return Recipe.objects.filter(carts__cart__owner=self.request.user)
 
 
 class TechView(TemplateView, CartMixin):
@@ -179,31 +294,6 @@ class AboutView(TemplateView, CartMixin):
     template_name = 'about_arum.html'
 
 
-def get_ingredients(request):
-    ingredients = {}
-    errors = []
-    for key in request.POST:
-        if key.startswith('nameIngredient'):
-            value_ingredient = key[15:]
-            name = request.POST[key]
-            amount = request.POST[
-                'valueIngredient_' + value_ingredient
-            ]
-            ingredients[name] = amount
-            if int(amount) < 1:
-                errors.append('Количество должно быть больше 0')
-
-    if not ingredients:
-        errors.append('В рецепте должны быть ингридиенты')
-    for name in ingredients.keys():
-        try:
-            get_object_or_404(Ingredient, name=name)
-        except Http404:
-            errors.append(f'ингридиента {name} не существует')
-            return ingredients, errors
-    return ingredients, errors
-
-
 @login_required
 def new_recipe(request):
     if request.method != 'POST':
@@ -211,30 +301,17 @@ def new_recipe(request):
         return render(request, 'recipe_form.html', {'form': form})
 
     form = RecipeForm(request.POST, files=request.FILES or None)
-    ingredients, ingrid_errors = get_ingredients(request)
-
-    if ingrid_errors:
-        return render(request, 'recipe_form.html', {'form': form,
-                                                    'errors': ingrid_errors})
-
-    if form.is_valid():
-        tags = form.cleaned_data['tags']
-        recipe = form.save(commit=False)
-        recipe.author = request.user
-        recipe.save()
-        recipe_ingrids = []
-        for name, amount in ingredients.items():
-            ingredient = get_object_or_404(Ingredient, name=name)
-            recipe_ingrids.append(RecipeIngredient(
-                recipe_id=recipe.id, ingredient=ingredient, amount=amount
-            ))
-        for tag in tags:
-            RecipeTag.objects.get_or_create(recipe_id=recipe.id, tag=tag)
-        RecipeIngredient.objects.bulk_create(recipe_ingrids)
+    writer = RecipeWriter.from_post(request.POST)
 
+    if not writer.errors and form.is_valid():
+        writer.save(form, author=request.user)
         return redirect('index')
 
-    return render(request, 'recipe_form.html', {'form': form})
+    return render(request, 'recipe_form.html', {
+        'form': form,
+        'errors': writer.errors,
+        'ingredients': writer.rows(),
+    })
 
 
 @login_required
@@ -245,29 +322,21 @@ def recipe_edit(request, username, pk):
 
     form = RecipeForm(request.POST or None, files=request.FILES or None,
                       instance=instance)
-    RecipeIngredient.objects.filter(recipe_id=pk).delete()
+    context = {
+        'form': form,
+        'recipe': instance,
+        'ingredients': instance.recipe.select_related('ingredient'),
+    }
 
     if request.method == 'POST':
-        ingredients, ingrid_errors = get_ingredients(request)
-        if ingrid_errors:
-            return render(request, 'recipe_form.html',
-                          {'form': form,
-                           'recipe': instance,
-                           'errors': ingrid_errors})
-
-        if form.is_valid():
-            recipe = form.save()
-            recipe_ingrids = []
-            for name, amount in ingredients.items():
-                ingredient = get_object_or_404(Ingredient, name=name)
-                recipe_ingrids.append(RecipeIngredient(
-                    recipe=recipe, ingredient=ingredient, amount=amount
-                ))
-                RecipeIngredient.objects.bulk_create(recipe_ingrids)
+        writer = RecipeWriter.from_post(request.POST)
+        if not writer.errors and form.is_valid():
+            writer.save(form)
             return redirect('index')
+        context['errors'] = writer.errors
+        context['ingredients'] = writer.rows()
 
-    return render(request, 'edit_recipe.html',
-                  {'form': form, 'recipe': instance})
+    return render(request, 'edit_recipe.html', context)
 
 
 def page_not_found(request, exception):
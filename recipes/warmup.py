@@ -0,0 +1,115 @@
+"""Warm-up of a fresh server process before it takes requests.
+
+`warm_up` pays the first-request costs of a worker at start instead:
+it compiles the project templates into the cached loader, builds the
+URL resolvers, resolves DRF settings, opens database connections and
+fills the process-local catalogs. It runs from the gunicorn
+`post_worker_init` hook (`gunicorn.conf.py`) and on ASGI lifespan
+startup (`foodgram.asgi`). A failing step is logged and skipped, it
+never keeps a worker from starting.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.urls import get_resolver
+from rest_framework.settings import api_settings
+
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Tag
+from recipes.pantry import pantry_index
+
+TEMPLATE_EXTENSIONS = ('.html', '.txt')
+DRF_SETTINGS = (
+    'DEFAULT_RENDERER_CLASSES',
+    'DEFAULT_PARSER_CLASSES',
+    'DEFAULT_AUTHENTICATION_CLASSES',
+    'DEFAULT_PERMISSION_CLASSES',
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS',
+)
+
+
+def project_templates(engine):
+    """Names of templates found in project (not site-packages) dirs."""
+    base_dir = str(settings.BASE_DIR)
+    for directory in engine.template_dirs:
+        directory = str(directory)
+        if not directory.startswith(base_dir) or 'site-packages' in directory:
+            continue
+        for root, _, files in os.walk(directory):
+            for file in files:
+                if file.endswith(TEMPLATE_EXTENSIONS):
+                    path = os.path.join(root, file)
+                    yield os.path.relpath(path, directory)
+
+
+def templates():
+    count = 0
+    for engine in engines.all():
+        for name in project_templates(engine):
+            engine.get_template(name)
+            count += 1
+    return f'{count} templates'
+
+
+def urls():
+    resolver = get_resolver()
+    resolver.resolve('/')
+    return f'{len(resolver.reverse_dict)} url names'
+
+
+def rest_framework():
+    for name in DRF_SETTINGS:
+        getattr(api_settings, name)
+    return 'settings loaded'
+
+
+def databases():
+    for alias in connections:
+        connections[alias].ensure_connection()
+    return ', '.join(connections)
+
+
+def catalogs():
+    tags = Tag.ids_by_slug()
+    snapshot = ingredient_index.get_snapshot()
+    return f'{len(tags)} tags, {len(snapshot.keys)} ingredients'
+
+
+def pantry():
+    snapshot = pantry_index.get_snapshot()
+    return f'{len(snapshot.postings)} ingredients indexed'
+
+
+STEPS = {
+    'templates': templates,
+    'urls': urls,
+    'rest_framework': rest_framework,
+    'databases': databases,
+    'catalogs': catalogs,
+    'pantry': pantry,
+}
+
+
+def warm_up(steps=None, log=None, notify=None):
+    """Run warm-up steps, return `{step: milliseconds}`.
+
+    `steps` default to `settings.WARM_UP_STEPS`. `log` receives a line
+    per step, `notify` is called after each one (gunicorn workers must
+    report that they are alive).
+    """
+    timings = {}
+    for name in settings.WARM_UP_STEPS if steps is None else steps:
+        started = time.perf_counter()
+        try:
+            result = STEPS[name]()
+        except Exception as error:
+            result = f'failed: {error!r}'
+        timings[name] = round(1000 * (time.perf_counter() - started), 1)
+        if log is not None:
+            log(f'warm-up {name}: {result}, {timings[name]} ms')
+        if notify is not None:
+            notify()
+    return timings
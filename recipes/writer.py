@@ -0,0 +1,131 @@
+from django.db import transaction
+
+from recipes import changes
+from recipes.models import Ingredient, RecipeIngredient, RecipeTag
+
+INGREDIENT_NAME_PREFIX = 'nameIngredient_'
+INGREDIENT_AMOUNT_PREFIX = 'valueIngredient_'
+
+
+class RecipeWriter:
+    """Create or update a recipe with its ingredients and tags.
+
+    Submitted ingredient names are resolved with one IN query. The
+    recipe is saved in one transaction that applies only the difference
+    to its ingredient and tag rows, and one `recipes_changed` event is
+    sent after commit.
+    """
+
+    def __init__(self, amounts, errors=()):
+        self.amounts = amounts
+        self.errors = list(errors)
+        self.ingredients = {}
+        self.unknown = []
+        self._resolve()
+
+    @classmethod
+    def from_post(cls, data):
+        """Writer for `nameIngredient_N`/`valueIngredient_N` fields."""
+        amounts = {}
+        errors = []
+        for key in data:
+            if not key.startswith(INGREDIENT_NAME_PREFIX):
+                continue
+            number = key[len(INGREDIENT_NAME_PREFIX):]
+            try:
+                amount = int(data[INGREDIENT_AMOUNT_PREFIX + number])
+            except (KeyError, ValueError):
+                amount = 0
+            if amount < 1:
+                errors.append('Количество должно быть больше 0')
+            amounts[data[key]] = amount
+        return cls(amounts, errors)
+
+    def _resolve(self):
+        if not self.amounts:
+            self.errors.append('В рецепте должны быть ингридиенты')
+            return
+        self.ingredients = {
+            ingredient.name: ingredient
+            for ingredient in Ingredient.objects.filter(
+                name__in=self.amounts,
+            )
+        }
+        for name in self.amounts:
+            if name not in self.ingredients:
+                self.unknown.append(name)
+                self.errors.append(f'ингридиента {name} не существует')
+
+    def rows(self):
+        """Unsaved `RecipeIngredient`s of submitted fields, in their order.
+
+        Forms re-render them when validation fails, unknown names get an
+        unsaved `Ingredient` without a unit.
+        """
+        return [
+            RecipeIngredient(
+                ingredient=self.ingredients.get(name) or Ingredient(name=name),
+                amount=amount,
+            )
+            for name, amount in self.amounts.items()
+        ]
+
+    def save(self, form, author=None):
+        """Save valid `RecipeForm` of a writer without errors."""
+        with transaction.atomic():
+            recipe = form.save(commit=False)
+            created = recipe.pk is None
+            if author is not None:
+                recipe.author = author
+            recipe.save()
+            self._set_tags(recipe, form.cleaned_data['tags'], created)
+            self._set_ingredients(recipe, created)
+            changes.touch([recipe.pk])
+        return recipe
+
+    @staticmethod
+    def _set_tags(recipe, tags, created):
+        wanted = {tag.pk for tag in tags}
+        current = set() if created else set(
+            RecipeTag.objects.filter(recipe=recipe)
+            .values_list('tag_id', flat=True)
+        )
+        if current - wanted:
+            RecipeTag.objects.filter(
+                recipe=recipe, tag_id__in=current - wanted,
+            ).delete()
+        RecipeTag.objects.bulk_create([
+            RecipeTag(recipe=recipe, tag_id=tag_id)
+            for tag_id in wanted - current
+        ])
+
+    def _set_ingredients(self, recipe, created):
+        wanted = {self.ingredients[name].pk: amount
+                  for name, amount in self.amounts.items()}
+        current = {}
+        stale = []
+        rows = [] if created else RecipeIngredient.objects.filter(
+            recipe=recipe,
+        ).only('pk', 'ingredient_id', 'amount')
+        for row in rows:
+            keep = (row.ingredient_id in wanted
+                    and row.ingredient_id not in current)
+            if keep:
+                current[row.ingredient_id] = row
+            else:
+                stale.append(row.pk)
+
+        if stale:
+            RecipeIngredient.objects.filter(pk__in=stale).delete()
+        changed = []
+        for ingredient_id, row in current.items():
+            if row.amount != wanted[ingredient_id]:
+                row.amount = wanted[ingredient_id]
+                changed.append(row)
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                             amount=amount)
+            for ingredient_id, amount in wanted.items()
+            if ingredient_id not in current
+        ])
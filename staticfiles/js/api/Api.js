@@ -115,6 +115,20 @@ class Api {
             return Promise.reject(e.statusText)
         })
   }
+    getUserState (recipeIds, authorIds) {
+        const params = new URLSearchParams();
+        recipeIds.forEach(id => params.append('recipes', id));
+        authorIds.forEach(id => params.append('authors', id));
+        return fetch(`/api/state/?${params}`, {
+            headers: this.headers,
+        })
+            .then( e => {
+                if(e.ok) {
+                    return e.json()
+                }
+                return Promise.reject(e.statusText)
+            })
+    }
     getIngredients  (text)  {
         return fetch(`/api/ingredients?query=${text}/`, {
             headers: this.headers,
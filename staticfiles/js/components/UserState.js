@@ -0,0 +1,56 @@
+class UserState {
+    constructor(api, counter, config) {
+        this.api = api;
+        this.counter = counter;
+        this.config = config;
+    }
+    hydrate (root) {
+        const cards = Array.from(root.querySelectorAll('[data-id]'));
+        const authors = Array.from(root.querySelectorAll('[data-author]'))
+            .filter(item => item.getAttribute('data-author'));
+        const recipeIds = cards.map(card => card.getAttribute('data-id'));
+        const authorIds = authors.map(item => item.getAttribute('data-author'));
+        return this.api.getUserState(recipeIds, authorIds)
+            .then( state => {
+                const favourites = new Set(state.favourites.map(String));
+                const purchases = new Set(state.purchases.map(String));
+                const following = new Set(state.following.map(String));
+                cards.forEach(card => {
+                    const id = card.getAttribute('data-id');
+                    if (favourites.has(id)) {
+                        this._activate(card, 'favorites', false);
+                        const tooltip = card.querySelector('.single-card__favorite-tooltip');
+                        if (tooltip) {
+                            tooltip.textContent = 'Убрать из избранного';
+                        }
+                    }
+                    if (purchases.has(id)) {
+                        this._activate(card, 'purchases', true);
+                    }
+                });
+                authors.forEach(item => {
+                    if (following.has(item.getAttribute('data-author'))) {
+                        this._activate(item, 'subscribe', true);
+                    }
+                });
+                this.counter.counterNum = state.purchases_count;
+                this.counter.counter.textContent = state.purchases_count;
+            })
+            .catch( e => {
+                console.log(e)
+            })
+    }
+    _activate (container, name, swapClass) {
+        const config = this.config[name];
+        const target = container.querySelector(`button[name="${name}"]`);
+        if (!config || !target || !target.hasAttribute(config.attr)) {
+            return;
+        }
+        target.innerHTML = config.active.text;
+        if (swapClass) {
+            target.classList.remove(config.default.class);
+            target.classList.add(config.active.class);
+        }
+        target.removeAttribute(config.attr);
+    }
+}
@@ -54,4 +54,6 @@ const authorRecipeSubscribe = new AuthorRecipe(container_subscribe, '.author-sub
 authorRecipe.addEvent();
 authorRecipeSubscribe.addEvent();
 
-
+if (counterId) {
+    new UserState(api, header, configButton).hydrate(document);
+}
@@ -36,4 +36,6 @@ const cardList = new CardList(container, '.card', header, api, true, {
 
 cardList.addEvent();
 
-
+if (counterId) {
+    new UserState(api, header, configButton).hydrate(document);
+}
@@ -48,4 +48,6 @@ const singleCard = new SingleCard(container, '.single-card', header, api, true,{
 });
 singleCard.addEvent();
 
-
+if (counterId) {
+    new UserState(api, header, configButton).hydrate(document);
+}